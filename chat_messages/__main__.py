@@ -0,0 +1,4 @@
+from chat_messages.cli import main
+
+
+main()
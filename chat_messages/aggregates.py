@@ -0,0 +1,109 @@
+from chat_messages.config import SENDER_COL, TEXT_COL, DATETIME_COL
+from chat_messages.time_utils import get_messages_time_features, get_day_keys, get_weekdays_of_day_keys
+
+import pandas as pd
+
+
+CUBE_KEY_COLS = [SENDER_COL, 'date', 'hour']
+CUBE_VALUE_COLS = ['rows', 'messages', 'words']
+BUCKETS = ['date', 'month', 'weekday', 'hour']
+
+
+def _add_calendar_cols(cube_df):
+    cube_df['month'] = (cube_df['date'] // 100).astype('int32')
+    cube_df['weekday'] = get_weekdays_of_day_keys(cube_df['date'])
+
+    return cube_df
+
+
+def merge_cubes(cubes):
+    """
+    Merge cubes of disjoint sets of messages, e.g. of chunks of a chat, into the cube of all of them.
+
+    Args:
+        cubes (list of MessageCube): Cubes to merge
+
+    Returns:
+        MessageCube: Summed counts
+    """
+    cube_df = pd.concat([cube.get_cube_df()[CUBE_KEY_COLS + CUBE_VALUE_COLS] for cube in cubes], ignore_index=True)
+
+    # Senders of different chunks have different categories, which concatenate to strings
+    cube_df[SENDER_COL] = cube_df[SENDER_COL].astype('category')
+    cube_df = cube_df.groupby(CUBE_KEY_COLS, observed=True, sort=True)[CUBE_VALUE_COLS].sum().reset_index()
+
+    return MessageCube(cube_df=_add_calendar_cols(cube_df))
+
+
+class MessageCube(object):
+    """
+    Counts of rows, messages and words by sender, date and hour of day, computed in one grouped pass over the
+    messages. Counts by any bucket and totals are rolled up from this small table instead of scanning the messages.
+    """
+
+    def __init__(self, messages_df=None, cube_df=None, time_features=None):
+        """
+        Constructor to aggregate a dataframe of messages, or to wrap an already aggregated cube.
+
+        Args:
+            messages_df (pd.DataFrame): Messages with sender, datetime and processed text columns
+            cube_df (pd.DataFrame): Aggregated counts, as returned by get_cube_df
+            time_features (pd.DataFrame): Calendar features of messages_df, if already computed
+        """
+        if cube_df is None:
+            cube_df = self._aggregate(messages_df, time_features)
+
+        self._cube_df = cube_df
+
+    @staticmethod
+    def _aggregate(messages_df, time_features=None):
+        if time_features is None:
+            time_features = get_messages_time_features(messages_df, DATETIME_COL)
+
+        texts = messages_df[TEXT_COL]
+
+        keys = [messages_df[SENDER_COL].rename(SENDER_COL), get_day_keys(time_features).rename('date'),
+                time_features['hour'].rename('hour')]
+        values = pd.DataFrame({'rows': 1,
+                               # Messages are counted like groupby().count(), which skips missing texts
+                               'messages': texts.notna().astype('int64'),
+                               # Same as len(str(message).split(' '))
+                               'words': texts.str.count(' ').fillna(0).astype('int64') + 1},
+                              index=messages_df.index)
+
+        return _add_calendar_cols(values.groupby(keys, observed=True, sort=True).sum().reset_index())
+
+    def get_cube_df(self):
+        return self._cube_df
+
+    def get_senders(self):
+        return self._cube_df[SENDER_COL].unique().tolist()
+
+    def get_sender_cube(self, sender):
+        """
+        Get the counts of a single sender as a cube of its own.
+        """
+        return MessageCube(cube_df=self._select(sender).reset_index(drop=True))
+
+    def _select(self, sender):
+        if sender is None:
+            return self._cube_df
+
+        return self._cube_df[self._cube_df[SENDER_COL] == sender]
+
+    def get_counts(self, bucket, sender=None, value='messages'):
+        """
+        Get counts by bucket.
+
+        Args:
+            bucket (str): One of 'date' (yyyymmdd key), 'month' (yyyymm key), 'weekday' (Monday is 0) or 'hour'
+            sender (str): Only count messages of this sender. All messages if None
+            value (str): One of 'rows', 'messages' or 'words'
+
+        Returns:
+            pd.Series: Counts indexed by sorted bucket keys
+        """
+        return self._select(sender).groupby(bucket)[value].sum()
+
+    def get_total(self, value='messages', sender=None):
+        return int(self._select(sender)[value].sum())
@@ -0,0 +1,164 @@
+from chat_messages.cleanup import get_messages, get_message_details, get_time_details, get_processed_text
+from chat_messages.store import write_messages, get_messages_dataframe
+from chat_messages.report import get_reports_by_sender
+from chat_messages.plots import Plots
+from chat_messages import synthetic
+
+import matplotlib.pyplot as plt
+import argparse
+import datetime
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+REPORT_GETTERS = ['get_number_of_messages', 'get_number_of_words', 'get_words_per_message', 'get_number_of_pictures_sent',
+                  'get_frequent_words', 'get_frequent_emojis', 'get_messages_by_weekday', 'get_messages_by_date',
+                  'get_messages_by_month', 'get_messages_by_hour_of_day', 'get_most_active_day']
+CHART_NAMES = ['messages_pie', 'words_pie', 'month_bar', 'weekday_bar', 'hour_bar']
+
+
+def measure(func, get_args=None, measure_memory=True):
+    """
+    Time a call and, optionally, measure its peak traced memory in a second call, so tracing does not slow the timed
+    call down.
+
+    Args:
+        func (function): Stage to measure
+        get_args (function): Builds fresh arguments of func for every call, outside of the measurement
+        measure_memory (bool): Also measure peak memory
+
+    Returns:
+        tuple: Result of the timed call, seconds taken and peak memory in MB (None if not measured)
+    """
+    args = get_args() if get_args else ()
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+
+    peak_mb = None
+
+    if measure_memory:
+        args = get_args() if get_args else ()
+        tracemalloc.start()
+
+        try:
+            func(*args)
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2.0 ** 20
+        finally:
+            tracemalloc.stop()
+
+    return result, seconds, peak_mb
+
+
+def run_benchmark(num_messages, num_senders=2, work_dir=None, seed=0, measure_memory=True):
+    """
+    Generate a synthetic export and measure every stage of the pipeline on it.
+
+    Args:
+        num_messages (int): Size of the export
+        num_senders (int): Number of participants
+        work_dir (str): Directory for the export, the processed store and the charts. A temporary one if None
+        seed (int): Seed of the synthetic export
+        measure_memory (bool): Also measure peak memory of every stage
+
+    Returns:
+        list of dict: Stage, seconds, rows, rows per second and peak memory of every stage
+    """
+    work_dir = work_dir or tempfile.mkdtemp(prefix='chat_messages_benchmark_')
+    export_path = os.path.join(work_dir, 'export_{}.txt'.format(num_messages))
+    store_path = os.path.join(work_dir, 'processed_{}.parquet'.format(num_messages))
+    senders = synthetic.get_senders(num_senders)
+    sender_aliases = synthetic.get_sender_aliases(senders)
+
+    synthetic.write_export(export_path, num_messages, senders, seed=seed)
+    results = list()
+
+    def record(stage, func, get_args=None):
+        result, seconds, peak_mb = measure(func, get_args, measure_memory)
+        results.append({'num_messages': num_messages, 'num_senders': num_senders, 'stage': stage, 'seconds': seconds,
+                        'rows': num_messages, 'rows_per_second': num_messages / seconds if seconds else None,
+                        'peak_mb': peak_mb})
+
+        return result
+
+    # Cleanup stages. Stages modifying their input get a fresh copy
+    messages = record('cleanup.get_messages', lambda: list(get_messages(export_path)))
+    messages_df = record('cleanup.get_message_details', lambda: get_message_details(messages, sender_aliases=sender_aliases))
+    messages_df = record('cleanup.get_time_details', get_time_details, lambda: (messages_df.copy(),))
+    messages_df = record('cleanup.get_processed_text', get_processed_text, lambda: (messages_df.copy(),))
+
+    # Released once measured, the measurements above have all run
+    messages = None
+
+    record('store.write_messages', write_messages, lambda: (messages_df, store_path))
+    report_df = record('store.get_messages_dataframe', get_messages_dataframe, lambda: (store_path,))
+    messages_df = None
+
+    # Report stages. Reports cache statistics, so every measurement gets fresh ones
+    def get_reports(warm):
+        reports = get_reports_by_sender(report_df)
+
+        for report in reports:
+            if warm:
+                report.get_cube()
+                report.get_token_index()
+
+        return (reports,)
+
+    record('report.get_reports_by_sender', lambda: get_reports(False))
+    record('report.get_cube', lambda reports: [report.get_cube() for report in reports], lambda: get_reports(False))
+    record('report.get_token_index', lambda reports: [report.get_token_index() for report in reports], lambda: get_reports(False))
+
+    for getter in REPORT_GETTERS:
+        record('report.' + getter, lambda reports: [getattr(report, getter)() for report in reports], lambda: get_reports(True))
+
+    # Plot stages, rendered headless one after the other
+    plt.switch_backend('Agg')
+    plot_obj = Plots(*get_reports(True)[0])
+    specs = plot_obj.get_chart_specs([os.path.join(work_dir, '{}_{}.png'.format(chart_name, num_messages)) for chart_name in CHART_NAMES])
+
+    for chart_name, spec in zip(CHART_NAMES, specs):
+        record('plots.' + chart_name, Plots.render_chart, lambda: (spec,))
+
+    return results
+
+
+def format_result(result):
+    peak = '' if result['peak_mb'] is None else '{:10.1f} MB'.format(result['peak_mb'])
+    throughput = '' if result['rows_per_second'] is None else '{:14,.0f} rows/s'.format(result['rows_per_second'])
+
+    return '{:>10,} {:<36} {:9.3f} s {} {}'.format(result['num_messages'], result['stage'], result['seconds'], throughput, peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the chat messages pipeline on synthetic exports.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Numbers of messages to benchmark')
+    parser.add_argument('--senders', type=int, default=2, help='Number of participants')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help='Directory for generated files. A temporary directory by default')
+    parser.add_argument('--no-memory', action='store_true', help='Only measure time')
+    parser.add_argument('--output', help='Append results as JSON lines to this file, to track them over time')
+    args = parser.parse_args()
+
+    run_at = datetime.datetime.now().isoformat()
+
+    for num_messages in args.sizes:
+        results = run_benchmark(num_messages, args.senders, args.work_dir, args.seed, not args.no_memory)
+
+        for result in results:
+            print(format_result(result))
+
+        if args.output:
+            with open(args.output, 'a') as f:
+                for result in results:
+                    f.write(json.dumps(dict(result, run_at=run_at)) + '\n')
+
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+from chat_messages.config import CHECKPOINT_TAIL_BYTES
+
+import pandas as pd
+import hashlib
+import json
+import os
+
+
+def get_tail_hash(file_path, offset, tail_bytes=CHECKPOINT_TAIL_BYTES):
+    """
+    Get a content hash of the bytes of a file just before an offset.
+    """
+    start = max(0, offset - tail_bytes)
+
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+
+        return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+
+def make_checkpoint(file_path, offset, last_datetime):
+    """
+    Describe how far an export has been ingested.
+
+    Args:
+        file_path (str): Path of the exported messages file
+        offset (int): Number of bytes of the export which have been processed
+        last_datetime (pd.Timestamp): Timestamp of the last processed message, None if there is none
+
+    Returns:
+        dict: Offset, last timestamp and hash of the tail of the processed bytes
+    """
+    return {'offset': offset,
+            'last_datetime': None if last_datetime is None else pd.Timestamp(last_datetime).isoformat(),
+            'tail_hash': get_tail_hash(file_path, offset)}
+
+
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return None
+
+    with open(checkpoint_path, 'r') as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    # Write aside and rename, so a crash never leaves a truncated checkpoint
+    temp_path = checkpoint_path + '.tmp'
+
+    with open(temp_path, 'w') as f:
+        json.dump(checkpoint, f)
+
+    os.replace(temp_path, checkpoint_path)
+
+
+def get_last_datetime(checkpoint):
+    if checkpoint['last_datetime'] is None:
+        return None
+
+    return pd.Timestamp(checkpoint['last_datetime'])
+
+
+def is_prefix_unchanged(file_path, checkpoint):
+    """
+    Check that an export still starts with the bytes processed at the checkpoint, as far as its tail hash can tell.
+    """
+    offset = checkpoint['offset']
+
+    return os.path.getsize(file_path) >= offset and get_tail_hash(file_path, offset) == checkpoint['tail_hash']
@@ -1,12 +1,30 @@
-from chat_messages.config import ORIGINAL_MESSAGES_PATH, PROCESSED_MESSAGES_PATH, CSV_SEP
-from chat_messages.text_utils import identify_forwards, identify_links, identify_special_texts, separate_emojis_at_the_end_of_tokens, convert_smileys_to_emojis, separate_special_characters_at_the_end_of_tokens
+from chat_messages.config import ORIGINAL_MESSAGES_PATH, PROCESSED_MESSAGES_PATH, CHECKPOINT_PATH, MESSAGES_ENCODING, CLEANUP_NUM_WORKERS, CLEANUP_CHUNKS_PER_WORKER, CLEANUP_BATCH_SIZE, FIXED_FORMAT_HEADERS, COMPACT_SCHEMA, MESSAGE_DATETIME_FORMAT, SENDER_ALIASES, DEFAULT_SENDER
+from chat_messages.time_utils import get_time_features
+from chat_messages.store import STRING_DTYPE, write_messages, append_messages, get_compact_messages_df
+from chat_messages.checkpoint import make_checkpoint, load_checkpoint, save_checkpoint, get_last_datetime, is_prefix_unchanged
+from chat_messages.metrics import stage, instrumented
+from chat_messages.text_utils import identify_forwards, identify_links, identify_special_texts, normalize_text, normalize_texts
 
 
-from dateutil.parser import parse
 import pandas as pd
+import multiprocessing
+import itertools
+import io
+import os
+import re
 
 
-def starts_with_date(line):
+# "dd.mm.yyyy HH:MM:SS, Sender: text" header of an exported message
+MESSAGE_HEADER_RE = re.compile(r'(?P<time>\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}:\d{2}), (?P<user>[^:]*):(?P<text>.*)', re.DOTALL)
+
+
+def starts_with_date(line, fixed_format=FIXED_FORMAT_HEADERS):
+    if fixed_format:
+        return MESSAGE_HEADER_RE.match(line) is not None
+
+    # Only the dateutil based detection of older exports needs dateutil
+    from dateutil.parser import parse
+
     first_ten_chars = line[:10]
 
     try:
@@ -16,24 +34,172 @@ def starts_with_date(line):
         return False
 
 
-def get_messages():
-    with open(ORIGINAL_MESSAGES_PATH, 'r') as f:
-        lines = f.readlines()
+def get_messages(file_path=ORIGINAL_MESSAGES_PATH, fixed_format=FIXED_FORMAT_HEADERS):
+    """
+    Lazily read complete messages from a Telegram text export.
+
+    Lines which do not start with a date are continuations of the previous message and are stuck to it. Only the
+    lines of the message being assembled are held in memory.
+
+    Args:
+        file_path (str): Path of the exported messages file
+        fixed_format (bool): Detect message starts with the fixed export header instead of dateutil
 
-    messages = list()
+    Yields:
+        str: One complete (possibly multi-line) message at a time
+    """
+    with open(file_path, 'r', encoding=MESSAGES_ENCODING) as f:
+        for message in iter_messages(f, fixed_format):
+            yield message
+
+
+def iter_messages(lines, fixed_format=FIXED_FORMAT_HEADERS):
+    """
+    Group an iterable of raw export lines into complete messages.
+
+    Args:
+        lines (iterable of str): Lines of the export, with line endings
+        fixed_format (bool): Detect message starts with the fixed export header instead of dateutil
+
+    Yields:
+        str: One complete (possibly multi-line) message at a time
+    """
+    message_lines = list()
 
     for line in lines:
-        if starts_with_date(line):
-            messages.append(line)
-        else:
-            prev_message = messages.pop()
-            prev_message += line
-            messages.append(prev_message)
+        if starts_with_date(line, fixed_format):
+            if message_lines:
+                yield ''.join(message_lines)
+            message_lines = [line]
+        elif message_lines:
+            message_lines.append(line)
+
+    if message_lines:
+        yield ''.join(message_lines)
+
+
+def find_message_start(f, fixed_format=FIXED_FORMAT_HEADERS):
+    """
+    Find the byte offset of the first message starting at or after the current position of a binary file.
+
+    Args:
+        f (file): Export opened in binary mode, positioned at the start of a line
+        fixed_format (bool): Detect message starts with the fixed export header instead of dateutil
+
+    Returns:
+        int: Offset of the next message start, or the file size if there is none
+    """
+    while True:
+        offset = f.tell()
+        line = f.readline()
+
+        if not line or starts_with_date(line.decode(MESSAGES_ENCODING, errors='replace'), fixed_format):
+            return offset
+
+
+def get_chunk_offsets(file_path, num_chunks, fixed_format=FIXED_FORMAT_HEADERS, start=0, end=None):
+    """
+    Split an export into roughly equal byte ranges which only start at message boundaries, so that continuation
+    lines stay in the chunk of their message.
+
+    Args:
+        file_path (str): Path of the exported messages file
+        num_chunks (int): Number of chunks wanted. Fewer are returned for small files
+        fixed_format (bool): Detect message starts with the fixed export header instead of dateutil
+        start (int): Offset of a message start to split from
+        end (int): Offset to split up to. The file size if None
+
+    Returns:
+        list of int: Increasing offsets from start to end. Chunk i spans offsets[i] to offsets[i + 1]
+    """
+    end = os.path.getsize(file_path) if end is None else end
+    offsets = [start]
+
+    with open(file_path, 'rb') as f:
+        for chunk_idx in range(1, num_chunks):
+            f.seek(max(start + (end - start) * chunk_idx // num_chunks, offsets[-1]))
 
-    return messages
+            # Skip the (possibly partial) line we landed in
+            f.readline()
+            offset = find_message_start(f, fixed_format)
 
+            if offset >= end:
+                break
+            offsets.append(offset)
+
+    offsets.append(end)
+
+    return offsets
+
+
+def read_chunk_messages(file_path, start, end, fixed_format=FIXED_FORMAT_HEADERS):
+    """
+    Get the complete messages in a byte range of an export which starts at a message boundary.
+
+    Returns:
+        iterator of str: Messages of the chunk
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    # Translate line endings like reading in text mode does
+    lines = io.StringIO(data.decode(MESSAGES_ENCODING), newline=None)
+
+    return iter_messages(lines, fixed_format)
+
+
+def get_sender(user_name, sender_aliases=SENDER_ALIASES, default_sender=DEFAULT_SENDER):
+    for alias, sender in sender_aliases.items():
+        if alias in user_name:
+            return sender
+
+    # Without a default sender, members matching no alias keep their own name
+    if default_sender is None:
+        return user_name.strip()
+
+    return default_sender
+
+
+def get_senders(user_names, sender_aliases=SENDER_ALIASES, default_sender=DEFAULT_SENDER):
+    """
+    Map exported user names to sender names, resolving every distinct user name only once.
+
+    Args:
+        user_names (pd.Series): User names as they appear in the export
+        sender_aliases (dict): Substring of a user name to the sender it belongs to
+        default_sender (str): Sender of user names matching no alias. The user name itself if None
+
+    Returns:
+        pd.Series: Sender of every message
+    """
+    sender_map = {user_name: get_sender(user_name, sender_aliases, default_sender) for user_name in user_names.unique()}
+
+    return user_names.map(sender_map)
+
+
+def get_message_details(messages, fixed_format=FIXED_FORMAT_HEADERS, sender_aliases=SENDER_ALIASES, default_sender=DEFAULT_SENDER):
+    if not fixed_format:
+        return get_message_details_dateutil(messages, sender_aliases, default_sender)
+
+    # Split all headers at once, dropping messages without a valid one
+    details = pd.Series(list(messages), dtype=STRING_DTYPE if COMPACT_SCHEMA else object).str.extract(MESSAGE_HEADER_RE)
+    datetimes = pd.to_datetime(details['time'], format=MESSAGE_DATETIME_FORMAT, errors='coerce')
+    is_valid = datetimes.notna()
+    details = details[is_valid]
+
+    final_df = pd.DataFrame({'time': details['time'],
+                             'sender': get_senders(details['user'], sender_aliases, default_sender).astype('category'),
+                             'text': details['text'].str.strip(),
+                             'datetime': datetimes[is_valid]})
+    final_df = final_df[['time', 'sender', 'text', 'datetime']].reset_index(drop=True)
+
+    return final_df
+
+
+def get_message_details_dateutil(messages, sender_aliases=SENDER_ALIASES, default_sender=DEFAULT_SENDER):
+    from dateutil.parser import parse
 
-def get_message_details(messages):
     message_times = list()
     senders = list()
     message_texts = list()
@@ -51,18 +217,12 @@ def get_message_details(messages):
             remaining_line = message[21:]
 
             # Get user name
-            for idx, char in enumerate(remaining_line):
-                if char == ':':
-                    colon_idx = idx
-                    break
+            colon_idx = remaining_line.index(':')
 
             user_text = remaining_line[:colon_idx]
             remaining_line = remaining_line[colon_idx + 2:]
 
-            if 'Sravan' in user_text:
-                sender = 'Sravan'
-            else:
-                sender = 'Harsha'
+            sender = get_sender(user_text, sender_aliases, default_sender)
 
             # Get actual text
             text = remaining_line.strip()
@@ -80,23 +240,18 @@ def get_message_details(messages):
     return final_df
 
 
+@instrumented('cleanup.get_time_details', len)
 def get_time_details(messages_df):
-    # Get year, month, date, hour, min, sec, weekday from datetime object
-    messages_df['year'] = messages_df['datetime'].apply(lambda dt: dt.year)
-    messages_df['month'] = messages_df['datetime'].apply(lambda dt: dt.month)
-    messages_df['date'] = messages_df['datetime'].apply(lambda dt: dt.day)
-    messages_df['hour'] = messages_df['datetime'].apply(lambda dt: dt.hour)
-    messages_df['minute'] = messages_df['datetime'].apply(lambda dt: dt.minute)
-    messages_df['second'] = messages_df['datetime'].apply(lambda dt: dt.second)
-    messages_df['weekday'] = messages_df['datetime'].apply(lambda dt: dt.strftime("%A"))
+    # Get year, month, date, hour, min, sec, weekday from datetime column
+    time_features = get_time_features(messages_df['datetime'])
+
+    for column in time_features.columns:
+        messages_df[column] = time_features[column]
 
     return messages_df
 
 
 def process_text_message(text):
-    # Lower
-    text = text.lower()
-
     # # Check if message is not a regular text
     # if_forward = identify_forwards(text)
     # if_link = identify_links(text)
@@ -110,37 +265,163 @@ def process_text_message(text):
     #     text = special_text
     # else:
 
-    # Separate emojis at the end of words
-    text = separate_emojis_at_the_end_of_tokens(text)
+    # Lower, separate emojis and special characters at the end of words and convert smileys to emojis
+    return normalize_text(text)
 
-    # Separate special characters at the end of words
-    text = separate_special_characters_at_the_end_of_tokens(text)
 
-    # Convert smileys to emojis
-    text = convert_smileys_to_emojis(text)
+@instrumented('cleanup.get_processed_text', len)
+def get_processed_text(messages_df):
+    messages_df['processed_text'] = normalize_texts(messages_df['text'])
 
-    return text
+    return messages_df
 
 
-def get_processed_text(messages_df):
-    messages_df['processed_text'] = messages_df['text'].apply(lambda text: process_text_message(text))
+def get_messages_df(messages, fixed_format=FIXED_FORMAT_HEADERS, default_sender=DEFAULT_SENDER, batch_size=CLEANUP_BATCH_SIZE):
+    """
+    Run the cleanup pipeline over lazily produced messages, batch_size messages at a time, so that only one batch of
+    raw messages and intermediate columns is in memory besides the processed messages.
+
+    Returns:
+        pd.DataFrame: Processed messages in the compact schema
+    """
+    messages = iter(messages)
+    batch_dfs = list()
+
+    while True:
+        # Read a batch on its own, to tell reading apart from parsing
+        with stage('cleanup.read_messages') as record:
+            batch = list(itertools.islice(messages, batch_size))
+            record['rows'] = len(batch)
+
+        if batch or not batch_dfs:
+            # Get message dataframe
+            with stage('cleanup.get_message_details', len(batch)):
+                batch_df = get_message_details(batch, fixed_format, default_sender=default_sender)
+
+            # Get time related details
+            batch_df = get_time_details(batch_df)
+
+            # Process text message
+            batch_df = get_processed_text(batch_df)
+
+            batch_dfs.append(get_compact_messages_df(batch_df))
+
+        if len(batch) < batch_size:
+            break
+
+    if len(batch_dfs) == 1:
+        return batch_dfs[0]
+
+    # Categories differ between batches, concatenating them falls back to objects
+    return get_compact_messages_df(pd.concat(batch_dfs, ignore_index=True))
+
+
+def process_chunk(chunk):
+    file_path, start, end, fixed_format, default_sender = chunk
+
+    return get_messages_df(read_chunk_messages(file_path, start, end, fixed_format), fixed_format, default_sender)
+
+
+def get_messages_df_parallel(file_path=ORIGINAL_MESSAGES_PATH, num_workers=CLEANUP_NUM_WORKERS, fixed_format=FIXED_FORMAT_HEADERS, start=0, end=None,
+                             default_sender=DEFAULT_SENDER):
+    """
+    Run the cleanup pipeline over byte-range chunks of an export in a pool of processes.
+
+    Args:
+        file_path (str): Path of the exported messages file
+        num_workers (int): Number of processes. None uses all cores
+        fixed_format (bool): Detect message starts with the fixed export header instead of dateutil
+        start (int): Offset of the message start to process from
+        end (int): Offset to process up to. The file size if None
+        default_sender (str): Sender of user names matching no alias. The user name itself if None
+
+    Returns:
+        pd.DataFrame: Processed messages in export order, as produced by the serial pipeline
+    """
+    num_workers = num_workers or multiprocessing.cpu_count()
+    offsets = get_chunk_offsets(file_path, num_workers * CLEANUP_CHUNKS_PER_WORKER, fixed_format, start, end)
+    chunks = [(file_path, start, end, fixed_format, default_sender) for start, end in zip(offsets[:-1], offsets[1:])]
+
+    with multiprocessing.Pool(num_workers) as pool:
+        chunk_dfs = pool.map(process_chunk, chunks)
+
+    # Categories differ between chunks, concatenating them falls back to objects
+    return get_compact_messages_df(pd.concat(chunk_dfs, ignore_index=True))
+
+
+def get_new_messages_df(file_path, checkpoint, end, num_workers=CLEANUP_NUM_WORKERS, fixed_format=FIXED_FORMAT_HEADERS, default_sender=DEFAULT_SENDER):
+    """
+    Run the cleanup pipeline only over the bytes appended to an export since a checkpoint.
+
+    Args:
+        file_path (str): Path of the exported messages file
+        checkpoint (dict): Checkpoint saved by the previous run
+        end (int): Offset to process up to
+        num_workers (int): Number of processes. None uses all cores
+        fixed_format (bool): Detect message starts with the fixed export header instead of dateutil
+        default_sender (str): Sender of user names matching no alias. The user name itself if None
+
+    Returns:
+        pd.DataFrame: Processed new messages, or None if the export changed before the checkpoint and has to be
+            processed again in full
+    """
+    offset = checkpoint['offset']
+
+    if end < offset or not is_prefix_unchanged(file_path, checkpoint):
+        return None
+
+    # Appended bytes have to start a new message rather than continue the last processed one
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+
+        if offset < end and find_message_start(f, fixed_format) != offset:
+            return None
+
+    if num_workers == 1:
+        messages_df = process_chunk((file_path, offset, end, fixed_format, default_sender))
+    else:
+        messages_df = get_messages_df_parallel(file_path, num_workers, fixed_format, offset, end, default_sender)
+
+    last_datetime = get_last_datetime(checkpoint)
+
+    if len(messages_df) and last_datetime is not None and messages_df['datetime'].iloc[0] < last_datetime:
+        return None
 
     return messages_df
 
 
-def main():
-    # Get a list of messages. Stick new lines to previous message
-    messages = get_messages()
+def main(num_workers=CLEANUP_NUM_WORKERS, incremental=False, default_sender=DEFAULT_SENDER):
+    with stage('cleanup.main') as main_record:
+        # Everything up to the current end of the export is processed, the next run continues from there
+        export_size = os.path.getsize(ORIGINAL_MESSAGES_PATH)
+        checkpoint = load_checkpoint(CHECKPOINT_PATH) if os.path.exists(PROCESSED_MESSAGES_PATH) else None
+        messages_df = None
+
+        if incremental and checkpoint is not None:
+            messages_df = get_new_messages_df(ORIGINAL_MESSAGES_PATH, checkpoint, export_size, num_workers, default_sender=default_sender)
+
+        if messages_df is not None:
+            with stage('store.append_messages', len(messages_df)):
+                append_messages(messages_df, PROCESSED_MESSAGES_PATH)
+
+            last_datetime = messages_df['datetime'].iloc[-1] if len(messages_df) else get_last_datetime(checkpoint)
+        else:
+            if num_workers == 1:
+                # Lazily read messages. Stick new lines to previous message
+                messages_df = get_messages_df(get_messages(ORIGINAL_MESSAGES_PATH), default_sender=default_sender)
+            else:
+                # Same pipeline on chunks of the export, one process per core
+                with stage('cleanup.get_messages_df_parallel') as record:
+                    messages_df = get_messages_df_parallel(ORIGINAL_MESSAGES_PATH, num_workers, end=export_size, default_sender=default_sender)
+                    record['rows'] = len(messages_df)
 
-    # Get message dataframe
-    messages_df = get_message_details(messages)
+            with stage('store.write_messages', len(messages_df)):
+                write_messages(messages_df, PROCESSED_MESSAGES_PATH)
 
-    # Get time related details
-    messages_df = get_time_details(messages_df)
+            last_datetime = messages_df['datetime'].iloc[-1] if len(messages_df) else None
 
-    # Process text message
-    messages_df = get_processed_text(messages_df)
-    messages_df.to_csv(PROCESSED_MESSAGES_PATH, CSV_SEP)
+        save_checkpoint(CHECKPOINT_PATH, make_checkpoint(ORIGINAL_MESSAGES_PATH, export_size, last_datetime))
+        main_record['rows'] = len(messages_df)
 
     print(messages_df.head(100))
 
@@ -0,0 +1,126 @@
+from chat_messages.config import PROCESSED_MESSAGES_PATH, CSV_SEP, CLEANUP_NUM_WORKERS, RENDER_NUM_WORKERS, DEFAULT_SENDER, REPORT_START_DATE, REPORT_END_DATE, RESULT_CACHE_DIR
+
+import argparse
+import datetime
+import json
+import sys
+
+# Only the standard library is imported here. Every command imports what it needs, so plain statistics never load
+# matplotlib or emoji
+
+
+def parse_date(date_str):
+    return datetime.datetime.fromisoformat(date_str)
+
+
+def ingest(args):
+    from chat_messages.cleanup import main as cleanup_main
+
+    cleanup_main(args.workers, args.incremental, None if args.keep_names else DEFAULT_SENDER)
+
+
+def get_stats(messages_file_path, senders=None, start_date=REPORT_START_DATE, end_date=REPORT_END_DATE, out_of_core=False, cache_dir=None):
+    """
+    Get the headline statistics of every sender.
+
+    Args:
+        messages_file_path (str): Processed messages file
+        senders (list of str): Senders to report on. Everyone in the chat if None
+        start_date (datetime): Start of the window. No limit if None
+        end_date (datetime): End of the window. No limit if None
+        out_of_core (bool): Read the messages a chunk at a time instead of all at once
+        cache_dir (str): Directory of the result cache to read and keep statistics in. Not cached if None
+
+    Returns:
+        list of dict: Sender, number of messages, words, words per message and pictures sent
+    """
+    if out_of_core:
+        from chat_messages.summary import get_summary_reports
+
+        reports = get_summary_reports(messages_file_path, senders, CSV_SEP, start_date, end_date)
+    else:
+        from chat_messages.store import get_messages_dataframe
+        from chat_messages.report import get_reports_by_sender
+        from chat_messages.results import ResultCache
+
+        result_cache = ResultCache(cache_dir) if cache_dir else None
+        reports = get_reports_by_sender(get_messages_dataframe(messages_file_path, CSV_SEP, start_date, end_date), senders, result_cache)
+
+    sender_stats = list()
+
+    for report in reports:
+        num_messages = int(report.get_number_of_messages())
+        num_words = int(report.get_number_of_words())
+
+        sender_stats.append({'sender': report.get_name(),
+                             'messages': num_messages,
+                             'words': num_words,
+                             'words_per_message': float(num_words) / num_messages if num_messages else 0.0,
+                             'pictures': int(report.get_number_of_pictures_sent())})
+
+    return sender_stats
+
+
+def stats(args):
+    sender_stats = get_stats(args.file, args.senders, args.start, args.end, args.out_of_core, args.cache_dir)
+
+    if args.json:
+        json.dump(sender_stats, sys.stdout)
+        sys.stdout.write('\n')
+        return
+
+    for sender_stat in sender_stats:
+        print('{sender}: {messages} messages, {words} words, {words_per_message:.2f} words per message, {pictures} pictures'.format(**sender_stat))
+
+
+def plot(args):
+    from chat_messages.controller import IMAGE_DIR, main as controller_main
+
+    controller_main(args.image_dir or IMAGE_DIR, args.start, args.end, args.workers, args.out_of_core, args.cache_dir, args.composite)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='chat_messages', description='Analysis of exported Telegram chats.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help='Process the exported messages into the processed messages file')
+    ingest_parser.add_argument('--workers', type=int, default=CLEANUP_NUM_WORKERS, help='Number of processes. 0 uses all cores')
+    ingest_parser.add_argument('--incremental', action='store_true', help='Only process messages exported since the last run')
+    ingest_parser.add_argument('--keep-names', action='store_true',
+                               help='Keep the exported names of members matching no alias instead of the default sender, for group chats')
+    ingest_parser.set_defaults(func=ingest)
+
+    for name, func, help_text in [('stats', stats, 'Print statistics of every sender'), ('plot', plot, 'Render all charts')]:
+        command_parser = subparsers.add_parser(name, help=help_text)
+        command_parser.add_argument('--start', type=parse_date, default=REPORT_START_DATE, help='Start of the window, YYYY-MM-DD')
+        command_parser.add_argument('--end', type=parse_date, default=REPORT_END_DATE, help='End of the window, YYYY-MM-DD')
+        command_parser.add_argument('--out-of-core', action='store_true', help='Read the messages a chunk at a time, for chats larger than memory')
+        command_parser.add_argument('--cache-dir', default=RESULT_CACHE_DIR, help='Directory of the result cache')
+        command_parser.add_argument('--no-cache', dest='cache_dir', action='store_const', const=None, help='Compute everything again')
+        command_parser.set_defaults(func=func)
+
+    stats_parser = subparsers.choices['stats']
+    stats_parser.add_argument('--file', default=PROCESSED_MESSAGES_PATH, help='Processed messages file')
+    stats_parser.add_argument('--senders', nargs='+', help='Senders to report on. Everyone by default')
+    stats_parser.add_argument('--json', action='store_true', help='Print the statistics as JSON')
+
+    plot_parser = subparsers.choices['plot']
+    plot_parser.add_argument('--image-dir', help='Directory to write the charts to')
+    plot_parser.add_argument('--workers', type=int, default=RENDER_NUM_WORKERS, help='Number of processes. 0 uses all cores')
+    plot_parser.add_argument('--composite', action='store_true', help='Render all charts and top words and emojis as one image')
+
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    # 0 workers means all cores, like None in config
+    if getattr(args, 'workers', None) == 0:
+        args.workers = None
+
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
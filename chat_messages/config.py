@@ -1,17 +1,68 @@
-from dateutil import parser
+import datetime
 
 # File Paths
 ORIGINAL_MESSAGES_PATH = '/Users/sravan/Desktop/projects/chat-messages/chat_messages/data/telegram_messages.txt'
-PROCESSED_MESSAGES_PATH = '/Users/sravan/Desktop/projects/chat-messages/chat_messages/data/processed_telegram_messages.csv'
+PROCESSED_MESSAGES_PATH = '/Users/sravan/Desktop/projects/chat-messages/chat_messages/data/processed_telegram_messages.parquet'
+CHECKPOINT_PATH = '/Users/sravan/Desktop/projects/chat-messages/chat_messages/data/processed_telegram_messages.checkpoint.json'
 
 # String Constants
 CSV_SEP = '\x01'
 
+# Export Format
+MESSAGES_ENCODING = 'utf-8'
+FIXED_FORMAT_HEADERS = True
+MESSAGE_DATETIME_FORMAT = '%d.%m.%Y %H:%M:%S'
+
+# Participants. Exported user names containing an alias are mapped to its sender, the rest to DEFAULT_SENDER. A
+# DEFAULT_SENDER of None keeps the exported user names as senders, e.g. for group chats
+SENDER_ALIASES = {'Sravan': 'Sravan', 'Harsha': 'Harsha'}
+DEFAULT_SENDER = 'Harsha'
+
+# Cleanup. CLEANUP_NUM_WORKERS of None uses all cores, 1 runs serially
+CLEANUP_NUM_WORKERS = 1
+CLEANUP_CHUNKS_PER_WORKER = 4
+# Messages parsed at a time, bounding the memory of raw messages and intermediate columns
+CLEANUP_BATCH_SIZE = 100000
+
+# Out-of-core Reports. Processed messages are read this many rows at a time
+OUT_OF_CORE_CHUNK_SIZE = 500000
+
+# Incremental Ingestion
+CHECKPOINT_TAIL_BYTES = 4096
+
+# Plots. RENDER_NUM_WORKERS of None uses all cores
+RENDER_NUM_WORKERS = None
+
+# Result Cache. Report statistics and rendered charts are kept in RESULT_CACHE_DIR, least recently used ones are
+# deleted beyond RESULT_CACHE_MAX_MB
+RESULT_CACHE_DIR = '/Users/sravan/Desktop/projects/chat-messages/chat_messages/data/cache'
+RESULT_CACHE_MAX_MB = 256
+
+# Schema. The compact schema keeps senders and weekdays categorical, time parts as small integers and texts as Arrow
+# backed strings. PERSIST_DROPPED_COLS are not written to the processed messages file, the raw header time and the time
+# parts can be derived from the datetime
+COMPACT_SCHEMA = True
+PERSIST_DROPPED_COLS = ['time', 'year', 'month', 'date', 'hour', 'minute', 'second', 'weekday']
+
+# Metrics. Every stage is appended to METRICS_PATH as a JSON line (standard error if None). Stages named in
+# METRICS_PROFILE_STAGES are also profiled into METRICS_PROFILE_DIR
+METRICS_ENABLED = True
+METRICS_PATH = '/Users/sravan/Desktop/projects/chat-messages/chat_messages/data/metrics.jsonl'
+METRICS_PROFILE_STAGES = []
+METRICS_PROFILE_DIR = '/Users/sravan/Desktop/projects/chat-messages/chat_messages/data/profiles'
+
 # DataFrame Column Names
 SENDER_COL = 'sender'
 TEXT_COL = 'processed_text'
 DATETIME_COL = 'datetime'
 
+# Replies. A message answering the previous message of someone else later than this is not counted as a reply
+REPLY_MAX_LATENCY_SECONDS = 12 * 60 * 60
+REPLY_PERCENTILES = [50, 90, 99]
+
+# Sessions. A message later than this after the previous message starts a new conversation
+SESSION_GAP_SECONDS = 60 * 60
+
 # Report Constants
-REPORT_START_DATE = parser.parse('2017-01-01')
-REPORT_END_DATE = parser.parse('2017-12-31')
+REPORT_START_DATE = datetime.datetime(2017, 1, 1)
+REPORT_END_DATE = datetime.datetime(2017, 12, 31)
@@ -1,43 +1,48 @@
-from chat_messages.config import PROCESSED_MESSAGES_PATH, CSV_SEP, REPORT_START_DATE, REPORT_END_DATE, DATETIME_COL, TEXT_COL
-from chat_messages.report import Report
-from chat_messages.plots import Plots
+from chat_messages.config import PROCESSED_MESSAGES_PATH, RENDER_NUM_WORKERS, CSV_SEP, REPORT_START_DATE, REPORT_END_DATE, RESULT_CACHE_DIR
+from chat_messages.store import get_messages_dataframe
+from chat_messages.report import get_reports_by_sender
+from chat_messages.summary import get_summary_reports
+from chat_messages.plots import Plots, render_charts
+from chat_messages.results import ResultCache
+from chat_messages.image import COMPOSITE_FILE_NAME, render_composite
+from chat_messages.metrics import stage
 
-import pandas as pd
-from dateutil import parser
+import os
 
 
-def get_messages_dataframe(messages_file_path, separator, start_date, end_date):
-    messages = pd.read_csv(messages_file_path, separator)
-    messages[DATETIME_COL] = messages[DATETIME_COL].apply(lambda date_str: parser.parse(date_str))
-
-    messages = messages[(messages[DATETIME_COL] >= start_date) & (messages[DATETIME_COL] <= end_date)]
-
-    return messages[['sender', 'datetime', 'processed_text']]
+IMAGE_DIR = '/Users/sravan/Desktop/projects/chat-messages/chat_messages/images'
 
 
 def get_messages_df_by_sender(messages_df, sender):
     return messages_df[messages_df['sender'] == sender]
 
 
-def main():
-    messages_df = get_messages_dataframe(PROCESSED_MESSAGES_PATH, CSV_SEP, REPORT_START_DATE, REPORT_END_DATE)
+def main(image_dir=IMAGE_DIR, start_date=REPORT_START_DATE, end_date=REPORT_END_DATE, num_workers=RENDER_NUM_WORKERS, out_of_core=False, cache_dir=RESULT_CACHE_DIR, composite=False):
+    with stage('controller.main') as record:
+        # Statistics and charts of unchanged messages are read from the cache instead of computed again
+        result_cache = ResultCache(cache_dir) if cache_dir else None
 
-    sravan_messages_df = messages_df[messages_df['sender'] == 'Sravan']
-    sravan_report = Report(sravan_messages_df, 'Sravan')
+        if out_of_core:
+            # Statistics merged chunk by chunk, the messages are never all in memory
+            reports = get_summary_reports(PROCESSED_MESSAGES_PATH, separator=CSV_SEP, start_date=start_date, end_date=end_date)
+        else:
+            with stage('store.get_messages_dataframe') as read_record:
+                messages_df = get_messages_dataframe(PROCESSED_MESSAGES_PATH, CSV_SEP, start_date, end_date)
+                read_record['rows'] = record['rows'] = len(messages_df)
 
-    harsha_messages_df = messages_df[messages_df['sender'] == 'Harsha']
-    harsha_report = Report(harsha_messages_df, 'Harsha')
+            # One report per participant, from a single pass over the messages
+            reports = get_reports_by_sender(messages_df, result_cache=result_cache)
 
-    plot_obj = Plots(harsha_report, sravan_report)
+        if composite:
+            # All charts and the top words, emojis and most active days on one figure
+            render_composite(reports, os.path.join(image_dir, COMPOSITE_FILE_NAME), result_cache=result_cache)
+            return
 
-    # Pie Charts
-    plot_obj.pie_chart_num_messages(display_plot=False, file_path='/Users/sravan/Desktop/projects/chat-messages/chat_messages/images/number_of_messages_sent_pie.png')
-    plot_obj.pie_chart_num_words(display_plot=False, file_path='/Users/sravan/Desktop/projects/chat-messages/chat_messages/images/number_of_words_sent_pie.png')
+        plot_obj = Plots(*reports)
 
-    # Side by side bar charts
-    plot_obj.bar_chart_messages_by_month(display_plot=False, file_path='/Users/sravan/Desktop/projects/chat-messages/chat_messages/images/messages_by_month_bar.png')
-    plot_obj.bar_chart_messages_by_weekday(display_plot=False, file_path='/Users/sravan/Desktop/projects/chat-messages/chat_messages/images/messages_by_weekday_bar.png')
-    plot_obj.bar_chart_messages_by_hour(display_plot=False, file_path='/Users/sravan/Desktop/projects/chat-messages/chat_messages/images/messages_by_hour_bar.png')
+        # Pie charts and side by side bar charts, rendered in parallel
+        file_names = ['number_of_messages_sent_pie.png', 'number_of_words_sent_pie.png', 'messages_by_month_bar.png', 'messages_by_weekday_bar.png', 'messages_by_hour_bar.png']
+        render_charts(plot_obj.get_chart_specs([os.path.join(image_dir, file_name) for file_name in file_names]), num_workers, result_cache=result_cache)
 
     return
 
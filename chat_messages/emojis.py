@@ -0,0 +1,165 @@
+from chat_messages.config import SENDER_COL, TEXT_COL, DATETIME_COL
+from chat_messages.text_utils import BATCH_SEP, get_emoji_re
+from chat_messages.time_utils import get_messages_time_features
+
+from array import array
+import pandas as pd
+import numpy as np
+
+
+EMOJI_BUCKETS = ['year', 'month', 'weekday', 'hour']
+
+
+class EmojiIndex(object):
+    """
+    Emojis of a column of texts, extracted with one longest-match scan over all texts so that skin tones, ZWJ
+    families and flags stay whole. Every distinct emoji gets an integer id, the emojis of all messages are kept as one
+    array of ids and message i spans emoji_ids[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, texts=None, vocabulary=None, emoji_ids=None, offsets=None):
+        """
+        Constructor to extract the emojis of texts, or to wrap an already built index.
+
+        Args:
+            texts (iterable of str): Message texts
+            vocabulary (list of str): Emoji of every id
+            emoji_ids (np.ndarray): int32 emoji ids of all messages, concatenated
+            offsets (np.ndarray): int64 start of every message in emoji_ids, followed by the number of emojis
+        """
+        if texts is not None:
+            vocabulary, emoji_ids, offsets = self._extract(texts)
+
+        self._vocabulary = vocabulary
+        self._emoji_ids = emoji_ids
+        self._offsets = offsets
+        self._emoji_counts = None
+
+    @staticmethod
+    def _extract(texts):
+        texts = [str(text) for text in texts]
+        emoji_ids = dict()
+        ids = array('i')
+        positions = array('q')
+
+        for match in get_emoji_re().finditer(BATCH_SEP.join(texts)):
+            ids.append(emoji_ids.setdefault(match.group(), len(emoji_ids)))
+            positions.append(match.start())
+
+        # Message of every emoji from where the texts start in the joined batch
+        text_starts = np.cumsum([0] + [len(text) + len(BATCH_SEP) for text in texts[:-1]], dtype=np.int64)
+        message_ids = np.searchsorted(text_starts, np.frombuffer(positions, dtype=np.int64), side='right') - 1
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(message_ids, minlength=len(texts)), out=offsets[1:])
+
+        # Ids are given in order of first appearance
+        return list(emoji_ids), np.frombuffer(ids, dtype=np.int32), offsets
+
+    def get_vocabulary(self):
+        return self._vocabulary
+
+    def get_emoji_ids(self):
+        return self._emoji_ids
+
+    def get_offsets(self):
+        return self._offsets
+
+    def get_number_of_messages(self):
+        return len(self._offsets) - 1
+
+    def get_number_of_emojis(self):
+        return len(self._emoji_ids)
+
+    def get_message_emojis(self, message_idx):
+        return [self._vocabulary[emoji_id] for emoji_id in self._emoji_ids[self._offsets[message_idx]:self._offsets[message_idx + 1]]]
+
+    def get_emoji_lists(self):
+        """
+        Get the emojis of every message, in order of appearance.
+        """
+        emojis = [self._vocabulary[emoji_id] for emoji_id in self._emoji_ids]
+        offsets = self._offsets.tolist()
+
+        return [emojis[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def get_emoji_counts(self):
+        """
+        Get the number of occurrences of every emoji id.
+
+        Returns:
+            np.ndarray: Count of every id of the vocabulary
+        """
+        if self._emoji_counts is None:
+            self._emoji_counts = np.bincount(self._emoji_ids, minlength=len(self._vocabulary))
+
+        return self._emoji_counts
+
+    def get_frequent_emojis(self):
+        """
+        Get emojis sorted by decreasing frequency, ties in order of first appearance.
+
+        Returns:
+            list of tuples: Emojis and frequencies
+        """
+        emoji_counts = self.get_emoji_counts()
+
+        return [(self._vocabulary[emoji_id], int(emoji_counts[emoji_id])) for emoji_id in np.argsort(-emoji_counts, kind='stable')]
+
+    def get_counts_by(self, keys):
+        """
+        Count emojis per group of messages.
+
+        Args:
+            keys (dict): Name of every key to group by to its values, one per message
+
+        Returns:
+            pd.DataFrame: Key columns, emoji and count, sorted by keys and decreasing count
+        """
+        message_ids = np.repeat(np.arange(self.get_number_of_messages()), np.diff(self._offsets))
+        key_names = list(keys)
+        emoji_df = pd.DataFrame({key_name: pd.Series(keys[key_name]).iloc[message_ids].to_numpy() for key_name in key_names})
+        emoji_df['emoji_id'] = self._emoji_ids
+
+        counts = emoji_df.groupby(key_names + ['emoji_id'], observed=True, sort=True).size().rename('count').reset_index()
+        counts = counts.sort_values(key_names + ['count'], ascending=[True] * len(key_names) + [False], kind='stable')
+        counts['emoji'] = np.asarray(self._vocabulary, dtype=object)[counts['emoji_id'].to_numpy()]
+
+        return counts[key_names + ['emoji', 'count']].reset_index(drop=True)
+
+
+def get_emoji_keys(messages_df, by, time_features=None):
+    """
+    Get the values of every key of get_emoji_counts, one per message.
+    """
+    keys = dict()
+
+    for key_name in by:
+        if key_name == SENDER_COL:
+            keys[key_name] = messages_df[SENDER_COL]
+        elif key_name in EMOJI_BUCKETS:
+            if time_features is None:
+                time_features = get_messages_time_features(messages_df, DATETIME_COL)
+
+            keys[key_name] = time_features[key_name]
+        else:
+            raise ValueError('Unknown key {}, use {} or one of {}'.format(key_name, SENDER_COL, EMOJI_BUCKETS))
+
+    return keys
+
+
+def get_emoji_counts(messages_df, by=(SENDER_COL,), emoji_index=None):
+    """
+    Count the emojis of messages by sender and by period, with one scan over all texts.
+
+    Args:
+        messages_df (pd.DataFrame): Messages of any number of senders
+        by (list of str): Keys to group by, sender and any of year, month, weekday and hour
+        emoji_index (EmojiIndex): Emojis of messages_df, already extracted
+
+    Returns:
+        pd.DataFrame: Key columns, emoji and count, sorted by keys and decreasing count
+    """
+    if emoji_index is None:
+        emoji_index = EmojiIndex(messages_df[TEXT_COL])
+
+    return emoji_index.get_counts_by(get_emoji_keys(messages_df, list(by)))
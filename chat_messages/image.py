@@ -1,28 +1,145 @@
-from chat_messages.report import Report
-from chat_messages.config import SENDER_COL
-from chat_messages.plots import Plots
+from chat_messages.config import RENDER_NUM_WORKERS
+from chat_messages.report import get_reports_by_sender
+from chat_messages.plots import Plots, render_charts, get_chart_key
+from chat_messages.results import get_result_key
+from chat_messages.metrics import stage
 
+import matplotlib as mpl
+from matplotlib.figure import Figure
 import os
 
 
+COMPOSITE_FILE_NAME = 'report.png'
+
+# Composite layout, in inches: every pie shares the first row with the first text panel, every bar chart takes a row and
+# the other text panels share the last row
+COMPOSITE_WIDTH = 20
+COMPOSITE_PIE_HEIGHT = 6
+COMPOSITE_BAR_HEIGHT = 4
+COMPOSITE_TEXT_HEIGHT = 5
+
+# Number of words and emojis listed per sender
+COMPOSITE_NUM_ITEMS = 10
+
+
+def get_text_panels(reports, num_items=COMPOSITE_NUM_ITEMS):
+    """
+    Get the text panels of the composite report: most active day of every sender, then top words and top emojis of
+    every sender.
+
+    Args:
+        reports (list of BaseReport): Report of every sender
+        num_items (int): Number of words and emojis listed per sender
+
+    Returns:
+        list of tuples: Title and lines of every panel
+    """
+    active_days = ['{}: {}'.format(report.get_name(), report.get_most_active_day() if report.get_number_of_messages() else '-')
+                   for report in reports]
+    panels = [('Most Active Day', active_days)]
+
+    for report in reports:
+        panels.append(('Top Words of {}'.format(report.get_name()),
+                       ['{}  {}'.format(word, count) for word, count in report.get_frequent_words()[:num_items]]))
+        panels.append(('Top Emojis of {}'.format(report.get_name()),
+                       ['{}  {}'.format(emoji, count) for emoji, count in report.get_frequent_emojis()[:num_items]]))
+
+    return panels
+
+
+def draw_composite(specs, panels, file_path, font_size=12.0, dpi=100):
+    """
+    Draw charts and text panels on one figure and save it. The figure is never shown, so no GUI backend is needed.
+
+    Args:
+        specs (list of dict): Chart specs, e.g. from Plots.get_chart_specs. Their figure sizes and files are ignored
+        panels (list of tuples): Title and lines of every text panel, e.g. from get_text_panels
+        file_path (str): File to save the figure to, in the format of its extension such as .png or .pdf
+        font_size (float): Font size of all charts and panels
+        dpi (int): Resolution of raster formats
+    """
+    pie_specs = [spec for spec in specs if spec['kind'] == 'pie']
+    bar_specs = [spec for spec in specs if spec['kind'] != 'pie']
+
+    row_heights = [COMPOSITE_PIE_HEIGHT] + [COMPOSITE_BAR_HEIGHT] * len(bar_specs) + [COMPOSITE_TEXT_HEIGHT] * (len(panels) > 1)
+
+    # Style set once for the whole figure instead of per chart
+    with mpl.rc_context({'font.size': font_size}):
+        # Fixed margins, a layout engine would draw the whole figure once more to measure it
+        fig = Figure(figsize=(COMPOSITE_WIDTH, sum(row_heights)), dpi=dpi)
+        grid = fig.add_gridspec(len(row_heights), 1, height_ratios=row_heights, left=0.05, right=0.97, bottom=0.02, top=0.97, hspace=0.4)
+
+        top_grid = grid[0].subgridspec(1, len(pie_specs) + 1)
+
+        for spec_idx, spec in enumerate(pie_specs):
+            Plots.draw_chart(fig.add_subplot(top_grid[spec_idx]), spec)
+
+        Image.draw_text(fig.add_subplot(top_grid[-1]), *panels[0])
+
+        for row_idx, spec in enumerate(bar_specs, 1):
+            Plots.draw_chart(fig.add_subplot(grid[row_idx]), spec)
+
+        if len(panels) > 1:
+            bottom_grid = grid[-1].subgridspec(1, len(panels) - 1, wspace=0.1)
+
+            for panel_idx, panel in enumerate(panels[1:]):
+                Image.draw_text(fig.add_subplot(bottom_grid[panel_idx]), *panel)
+
+        fig.savefig(file_path)
+
+
+def render_composite(reports, file_path, num_items=COMPOSITE_NUM_ITEMS, font_size=12.0, dpi=100, result_cache=None):
+    """
+    Render all charts and text panels of the reports to one image or PDF.
+
+    Args:
+        reports (list of BaseReport): Report of every sender
+        file_path (str): File to save the composite to, in the format of its extension such as .png or .pdf
+        num_items (int): Number of words and emojis listed per sender
+        font_size (float): Font size of all charts and panels
+        dpi (int): Resolution of raster formats
+        result_cache (ResultCache): Cache of rendered composites. A composite of the same values is copied from it
+            instead of rendered. Always rendered if None
+
+    Returns:
+        str: File written
+    """
+    with stage('image.render_composite', sum(report.get_number_of_messages() for report in reports)) as record:
+        specs = Plots(*reports).get_chart_specs([None] * 5)
+        panels = get_text_panels(reports, num_items)
+
+        key = get_result_key('composite', dpi, [get_chart_key(spec, font_size) for spec in specs], panels)
+        record['rendered'] = result_cache is None or not result_cache.load_file(key, file_path)
+
+        if record['rendered']:
+            draw_composite(specs, panels, file_path, font_size, dpi)
+
+            if result_cache is not None:
+                result_cache.store_file(key, file_path)
+
+    return file_path
+
+
 class Image(object):
     """
     Class to take all plots and make into one final image.
     """
-    def __init__(self, messages_df, person_one, person_two, image_dir='images'):
+    def __init__(self, messages_df, *senders, image_dir='images'):
         self._image_dir = image_dir
-        self._person_one_messages_df = messages_df[messages_df[SENDER_COL] == person_one]
-        self._person_one_report = Report(self._person_one_messages_df, person_one)
 
-        self._person_two_messages_df = messages_df[messages_df[SENDER_COL] == person_two]
-        self._person_two_report = Report(self._person_two_messages_df, person_two)
+        # Reports of the given senders, or of everyone in the chat if none are given
+        self._reports = get_reports_by_sender(messages_df, list(senders) or None)
 
         # Object to get all plots
-        self._plot_obj = Plots(self._person_one_report, self._person_two_report)
+        self._plot_obj = Plots(*self._reports)
 
-    def draw_plots(self):
+    def _get_file_names(self):
         file_names = ['number_of_messages_pie.png', 'number_of_words_pie.png', 'messages_by_month_bar.png', 'messages_by_weekday_bar.png', 'messages_by_hour_bar.png']
-        full_file_names = [os.path.join(self._image_dir, file_name) for file_name in file_names]
+
+        return [os.path.join(self._image_dir, file_name) for file_name in file_names]
+
+    def draw_plots(self):
+        full_file_names = self._get_file_names()
 
         # Pie Charts
         self._plot_obj.pie_chart_num_messages(display_plot=True, file_path=full_file_names[0])
@@ -35,6 +152,34 @@ class Image(object):
 
         return full_file_names
 
-    def draw_text(self, text):
+    def render_plots(self, num_workers=RENDER_NUM_WORKERS):
+        """
+        Save all plots without displaying them, rendering them in parallel processes.
+
+        Returns:
+            list of str: Files written
+        """
+        return render_charts(self._plot_obj.get_chart_specs(self._get_file_names()), num_workers)
+
+    def render_composite(self, file_path=None, num_items=COMPOSITE_NUM_ITEMS, font_size=12.0, dpi=100):
+        """
+        Save all plots and text panels as one image, or as a PDF if file_path ends with .pdf. See render_composite.
+
+        Returns:
+            str: File written
+        """
+        return render_composite(self._reports, file_path or os.path.join(self._image_dir, COMPOSITE_FILE_NAME), num_items, font_size, dpi)
+
+    @staticmethod
+    def draw_text(ax, title, lines):
+        """
+        Draw a text panel of one line per item.
 
-        return
\ No newline at end of file
+        Args:
+            ax (matplotlib.axes.Axes): Axes to draw on, without its axis
+            title (str): Title of the panel
+            lines (list of str): Lines of the panel, from the top
+        """
+        ax.set_axis_off()
+        ax.set_title(title)
+        ax.text(0.05, 0.95, '\n'.join(lines), transform=ax.transAxes, verticalalignment='top', horizontalalignment='left', linespacing=1.5)
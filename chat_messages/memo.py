@@ -0,0 +1,94 @@
+from chat_messages.metrics import stage
+from chat_messages.results import get_result_key
+
+import functools
+
+
+class StatisticsCache(object):
+    """
+    Cache of computed statistics with explicit dependencies. A statistic depends on sources (names of inputs which
+    can change) and on other statistics. Invalidating a source drops every cached statistic that depends on it,
+    directly or transitively.
+    """
+
+    def __init__(self):
+        self._values = dict()
+        self._dependents = dict()
+
+    def get(self, name, depends_on, args, compute):
+        """
+        Get a cached statistic, computing it on first use.
+
+        Args:
+            name (str): Name of the statistic
+            depends_on (tuple of str): Sources and statistics it is computed from
+            args (tuple): Arguments it was requested with, part of the cache key
+            compute (function): Computes the statistic
+
+        Returns:
+            object: The statistic
+        """
+        key = (name, args)
+
+        if key not in self._values:
+            self._values[key] = compute()
+
+            for dependency in depends_on:
+                self._dependents.setdefault(dependency, set()).add(name)
+
+        return self._values[key]
+
+    def invalidate(self, name):
+        """
+        Drop a source or statistic and everything depending on it.
+        """
+        names = {name}
+        pending = [name]
+
+        while pending:
+            for dependent in self._dependents.pop(pending.pop(), ()):
+                if dependent not in names:
+                    names.add(dependent)
+                    pending.append(dependent)
+
+        self._values = {key: value for key, value in self._values.items() if key[0] not in names}
+
+    def clear(self):
+        self._values = dict()
+        self._dependents = dict()
+
+
+def memoized(*depends_on, persist=False):
+    """
+    Decorator caching a method's result in the instance's _statistics_cache until one of depends_on is invalidated.
+    Every computation, not cache hits, is recorded as a metrics stage named after the class and method, with the rows
+    given by the instance's _get_metrics_rows if it has one.
+
+    With persist, the result is also kept in the instance's _result_cache if it has one, under a key made of the class,
+    method, arguments and the instance's _get_result_key, so that it outlives the instance.
+    """
+    def decorator(method):
+        name = method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            def compute():
+                with stage('{}.{}'.format(type(self).__name__, name)) as record:
+                    if hasattr(self, '_get_metrics_rows'):
+                        record['rows'] = self._get_metrics_rows()
+
+                    return method(self, *args)
+
+            result_cache = getattr(self, '_result_cache', None) if persist else None
+
+            if result_cache is None:
+                return self._statistics_cache.get(name, depends_on, args, compute)
+
+            def compute_persisted():
+                return result_cache.get(get_result_key(type(self).__name__, name, args, self._get_result_key()), compute)
+
+            return self._statistics_cache.get(name, depends_on, args, compute_persisted)
+
+        return wrapper
+
+    return decorator
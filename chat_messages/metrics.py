@@ -0,0 +1,183 @@
+from chat_messages.config import METRICS_ENABLED, METRICS_PATH, METRICS_PROFILE_STAGES, METRICS_PROFILE_DIR
+
+import contextlib
+import cProfile
+import datetime
+import functools
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is then not recorded
+    resource = None
+
+
+def get_peak_rss_mb():
+    """
+    Get the peak resident set size of this process so far, in MB. None where it is not available.
+    """
+    if resource is None:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak_rss / 2.0 ** 20 if sys.platform == 'darwin' else peak_rss / 2.0 ** 10
+
+
+@contextlib.contextmanager
+def cprofile_stage(stage_name, file_path):
+    """
+    Profile a stage with cProfile, dumping the stats to file_path. Any other profiler can be plugged into
+    MetricsRecorder with the same signature, e.g. a sampling profiler for long stages.
+    """
+    profile = cProfile.Profile()
+    profile.enable()
+
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(file_path)
+
+
+class MetricsRecorder(object):
+    """
+    Records wall time, rows processed, throughput and peak RSS of pipeline stages, emitted as one JSON object per line.
+    Stages can be nested, every record names its parent stage.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, file_path=METRICS_PATH, profile_stages=METRICS_PROFILE_STAGES,
+                 profile_dir=METRICS_PROFILE_DIR, profiler=cprofile_stage):
+        """
+        Args:
+            enabled (bool): Record stages. Stages are no-ops otherwise
+            file_path (str): JSON lines file the records are appended to. Standard error if None
+            profile_stages (list of str): Names of stages to also profile
+            profile_dir (str): Directory profiles are written to
+            profiler (function): Context manager factory taking the stage name and the profile file path
+        """
+        self._enabled = enabled
+        self._file_path = file_path
+        self._profile_stages = set(profile_stages)
+        self._profile_dir = profile_dir
+        self._profiler = profiler
+        self._stages = list()
+
+    def _get_profile(self, stage_name):
+        if stage_name not in self._profile_stages:
+            return contextlib.nullcontext()
+
+        os.makedirs(self._profile_dir, exist_ok=True)
+        file_name = '{}.{}.{}.prof'.format(stage_name, os.getpid(), datetime.datetime.now().strftime('%Y%m%d%H%M%S%f'))
+
+        return self._profiler(stage_name, os.path.join(self._profile_dir, file_name))
+
+    @contextlib.contextmanager
+    def stage(self, stage_name, rows=None):
+        """
+        Record a stage. The yielded record can be updated inside the stage, e.g. with the number of rows once known.
+
+        Args:
+            stage_name (str): Name of the stage
+            rows (int): Number of rows processed, if known up front
+        """
+        record = {'stage': stage_name, 'rows': rows}
+
+        if not self._enabled:
+            yield record
+            return
+
+        record['parent'] = self._stages[-1] if self._stages else None
+        record['pid'] = os.getpid()
+        record['started_at'] = datetime.datetime.now().isoformat()
+        peak_rss_before = get_peak_rss_mb()
+        self._stages.append(stage_name)
+        start = time.perf_counter()
+
+        try:
+            with self._get_profile(stage_name):
+                yield record
+        except BaseException as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self._stages.pop()
+            peak_rss = get_peak_rss_mb()
+            rows = None if record['rows'] is None else int(record['rows'])
+
+            record.update({'rows': rows,
+                           'seconds': seconds,
+                           'rows_per_second': rows / seconds if rows is not None and seconds > 0 else None,
+                           'peak_rss_mb': peak_rss,
+                           'peak_rss_growth_mb': peak_rss - peak_rss_before if peak_rss is not None else None})
+            self.emit(record)
+
+    def emit(self, record):
+        line = json.dumps(record, default=str) + '\n'
+
+        if self._file_path is not None:
+            try:
+                with open(self._file_path, 'a') as f:
+                    f.write(line)
+
+                return
+            except OSError:
+                # Metrics never fail a run, fall back to standard error
+                pass
+
+        sys.stderr.write(line)
+
+
+_recorder = None
+
+
+def get_recorder():
+    """
+    Get the recorder of this process, configured from config on first use.
+    """
+    global _recorder
+
+    if _recorder is None:
+        _recorder = MetricsRecorder()
+
+    return _recorder
+
+
+def set_recorder(recorder):
+    global _recorder
+
+    _recorder = recorder
+
+
+def stage(stage_name, rows=None):
+    return get_recorder().stage(stage_name, rows)
+
+
+def instrumented(stage_name, get_rows=None):
+    """
+    Decorator recording every call of a function as a stage.
+
+    Args:
+        stage_name (str): Name of the stage
+        get_rows (function): Gets the number of rows processed from the result of the call
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name) as record:
+                result = func(*args, **kwargs)
+
+                if get_rows is not None:
+                    record['rows'] = get_rows(result)
+
+            return result
+
+        return wrapper
+
+    return decorator
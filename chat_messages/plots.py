@@ -1,8 +1,17 @@
-from chat_messages.config import TEXT_COL
+from chat_messages.config import TEXT_COL, RENDER_NUM_WORKERS
+from chat_messages.metrics import stage
+from chat_messages.results import get_result_key
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import numpy as np
+import multiprocessing
+import os
+
+
+WEEKDAY_ORDER = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+MONTH_LABELS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
 
 
 class Plots(object):
@@ -10,26 +19,62 @@ class Plots(object):
     Class to represent all plots to go in the final image.
     """
 
-    def __init__(self, report_p1, report_p2, font_size=20):
+    def __init__(self, *reports, font_size=20):
         """
         Constructor to get dataframes of messages, colors of plots, etc.
+
+        Args:
+            reports (BaseReport): Report of every sender to compare, any number of them
+            font_size (int): Font size of all plots
         """
-        self._p1_report = report_p1
-        self._p2_report = report_p2
+        self._reports = list(reports)
         self._font_size = font_size
 
         # Set font size
         mpl.rcParams['font.size'] = 20.0
 
         # Get names for labels in plots
-        self._names = [report_p1.get_name(), report_p2.get_name()]
+        self._names = [report.get_name() for report in reports]
+
+    @staticmethod
+    def draw_pie(ax, values, labels, title):
+        ax.pie(values, startangle=90, labels=labels, autopct='%1.1f%%',)
+        ax.set_title(title)
+
+    @staticmethod
+    def draw_grouped_bars(ax, num_values, group_width, values, title, labels, xtick_labels):
+        """
+        Draw one bar per series side by side for each of num_values positions on existing axes. See grouped_bar_chart.
+        """
+        ind = np.arange(num_values)
+        width = float(group_width) / len(values)
+
+        rects = [ax.bar(ind + series_idx * width, series_values, width) for series_idx, series_values in enumerate(values)]
+
+        ax.set_title(title)
+        ax.set_xticks(ind + width * (len(values) - 1) / 2)
+        ax.set_xticklabels(xtick_labels)
+        ax.legend([series_rects[0] for series_rects in rects], labels)
+
+    @staticmethod
+    def draw_chart(ax, spec):
+        """
+        Draw a chart from its spec on existing axes, ignoring its figure size and file.
+
+        Args:
+            ax (matplotlib.axes.Axes): Axes to draw on
+            spec (dict): Kind of chart ('pie' or 'grouped_bar') and the arguments of its drawing method
+        """
+        drawers = {'pie': Plots.draw_pie, 'grouped_bar': Plots.draw_grouped_bars}
+        chart_args = {name: value for name, value in spec.items() if name not in ('figsize', 'save_file')}
+
+        drawers[chart_args.pop('kind')](ax, **chart_args)
 
     @staticmethod
     def pie_chart(figsize, values, labels, title, save_file=None, display_plot=False):
         fig = plt.figure(figsize=figsize)
         ax = fig.add_subplot(1, 1, 1)
-        ax.pie(values, startangle=90, labels=labels, autopct='%1.1f%%',)
-        plt.title(title)
+        Plots.draw_pie(ax, values, labels, title)
 
         if display_plot:
             plt.show()
@@ -37,19 +82,27 @@ class Plots(object):
         if save_file:
             fig.savefig(save_file)
 
-    @staticmethod
-    def side_by_side_bar_chart(num_values, width, figsize, values_one, values_two, title, labels, xtick_pos, xtick_labels, display_plot=False, save_file=None):
-        ind = np.arange(num_values)
+        plt.close(fig)
 
+    @staticmethod
+    def grouped_bar_chart(num_values, group_width, figsize, values, title, labels, xtick_labels, display_plot=False, save_file=None):
+        """
+        Draw one bar per series side by side for each of num_values positions.
+
+        Args:
+            num_values (int): Number of positions on the x axis
+            group_width (float): Width taken by the bars of one position, shared by all series
+            figsize (tuple): Size of the figure
+            values (list of list): Values of every series
+            title (str): Title of the plot
+            labels (list of str): Legend label of every series
+            xtick_labels (list): Label of every position
+            display_plot (bool): Show the plot
+            save_file (str): Path to save the plot to, if any
+        """
         fig = plt.figure(figsize=figsize)
         ax = fig.add_subplot(111)
-        rects1 = ax.bar(ind, values_one, width)
-        rects2 = ax.bar(ind + width, values_two, width)
-
-        ax.set_title(title)
-        ax.set_xticks(xtick_pos)
-        ax.set_xticklabels(xtick_labels)
-        ax.legend((rects1[0], rects2[0]), labels)
+        Plots.draw_grouped_bars(ax, num_values, group_width, values, title, labels, xtick_labels)
 
         if display_plot:
             plt.show()
@@ -57,71 +110,196 @@ class Plots(object):
         if save_file:
             fig.savefig(save_file)
 
-    def pie_chart_num_messages(self, file_path=None, display_plot=False):
+        plt.close(fig)
+
+    @staticmethod
+    def render_chart(spec, display_plot=False):
+        """
+        Draw a chart from its spec.
+
+        Args:
+            spec (dict): Kind of chart ('pie' or 'grouped_bar') and the arguments of its drawing method
+            display_plot (bool): Show the plot
+        """
+        renderers = {'pie': Plots.pie_chart, 'grouped_bar': Plots.grouped_bar_chart}
+        chart_args = dict(spec)
+
+        with stage('Plots.render_chart') as record:
+            record['chart'] = chart_args['title']
+            renderers[chart_args.pop('kind')](display_plot=display_plot, **chart_args)
+
+    @staticmethod
+    def _get_bucket_values(bucket_counts, bucket, bucket_keys):
+        return bucket_counts.set_index(bucket)[TEXT_COL].reindex(bucket_keys, fill_value=0).tolist()
+
+    def get_num_messages_pie_spec(self, file_path=None):
         figsize = (8, 8)
-        values = [len(self._p1_report.get_messages()), len(self._p2_report.get_messages())]
+        values = [report.get_number_of_messages() for report in self._reports]
         labels = self._names
         title = 'Number of Messages Sent'
 
-        self.pie_chart(figsize, values, labels, title, save_file=file_path, display_plot=display_plot)
+        return dict(kind='pie', figsize=figsize, values=values, labels=labels, title=title, save_file=file_path)
 
-    def pie_chart_num_words(self, file_path=None, display_plot=False):
+    def get_num_words_pie_spec(self, file_path=None):
         figsize = (8, 8)
-        values = [len(self._p1_report.get_words()), len(self._p2_report.get_words())]
+        values = [report.get_number_of_words() for report in self._reports]
         labels = self._names
         title = 'Number of Words Sent'
 
-        self.pie_chart(figsize, values, labels, title, save_file=file_path, display_plot=display_plot)
+        return dict(kind='pie', figsize=figsize, values=values, labels=labels, title=title, save_file=file_path)
 
-    def bar_chart_messages_by_weekday(self, file_path=None, display_plot=False):
+    def get_messages_by_weekday_bar_spec(self, file_path=None):
         num_values = 7
-        width = 0.35
+        group_width = 0.7
         figsize = (10, 8)
-        ind = width + np.arange(num_values)
 
-        values_one = self._p1_report.get_messages_by_weekday().reindex([3, 1, 5, 6, 4, 0, 2])[TEXT_COL].tolist()
-        values_two = self._p2_report.get_messages_by_weekday().reindex([3, 1, 5, 6, 4, 0, 2])[TEXT_COL].tolist()
+        values = [self._get_bucket_values(report.get_messages_by_weekday(), 'weekday', WEEKDAY_ORDER) for report in self._reports]
 
         title = 'Messages by Weekday'
         labels = self._names
 
-        xtick_pos = ( ind - (width / 2))
-        xtick_labels = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+        xtick_labels = [weekday[:3] for weekday in WEEKDAY_ORDER]
 
-        self.side_by_side_bar_chart(num_values, width, figsize, values_one, values_two, title, labels, xtick_pos, xtick_labels, display_plot=display_plot, save_file=file_path)
+        return dict(kind='grouped_bar', num_values=num_values, group_width=group_width, figsize=figsize, values=values,
+                    title=title, labels=labels, xtick_labels=xtick_labels, save_file=file_path)
 
-    def bar_chart_messages_by_month(self, file_path=None, display_plot=False):
-        num_values = 12
-        width = 0.35
-        figsize = (10, 8)
-        ind = width + np.arange(num_values)
+    def get_messages_by_month_bar_spec(self, file_path=None):
+        group_width = 0.7
+
+        # Months any sender sent messages in
+        month_counts = [report.get_messages_by_month() for report in self._reports]
+        months = sorted(set().union(*[counts['month'] for counts in month_counts]))
+        num_values = len(months)
 
-        values_one = self._p1_report.get_messages_by_month()[TEXT_COL].tolist()
-        values_two = self._p2_report.get_messages_by_month()[TEXT_COL].tolist()
+        # Wider for more than a year of months, so that their labels stay apart
+        figsize = (max(10, 0.8 * num_values), 8)
+
+        values = [self._get_bucket_values(counts, 'month', months) for counts in month_counts]
 
         title = 'Messages by Month'
         labels = self._names
 
-        xtick_pos = ( ind - width/2 )
-        xtick_labels = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+        # The year under the first month and every January, months of different years are told apart
+        xtick_labels = [MONTH_LABELS[int(month[5:]) - 1] + ('\n' + month[:4] if month_idx == 0 or month[5:] == '01' else '')
+                        for month_idx, month in enumerate(months)]
 
-        self.side_by_side_bar_chart(num_values, width, figsize, values_one, values_two, title, labels, xtick_pos,
-                                    xtick_labels, display_plot=display_plot, save_file=file_path)
+        return dict(kind='grouped_bar', num_values=num_values, group_width=group_width, figsize=figsize, values=values,
+                    title=title, labels=labels, xtick_labels=xtick_labels, save_file=file_path)
 
-    def bar_chart_messages_by_hour(self, file_path=None, display_plot=False):
+    def get_messages_by_hour_bar_spec(self, file_path=None):
         num_values = 24
-        width = 0.30
+        group_width = 0.6
         figsize = (14, 12)
-        ind = width + np.arange(num_values)
 
-        values_one = self._p1_report.get_messages_by_hour_of_day()[TEXT_COL].tolist()
-        values_two = self._p2_report.get_messages_by_hour_of_day()[TEXT_COL].tolist()
+        hours = ['{:02d}'.format(hour) for hour in range(num_values)]
+        values = [self._get_bucket_values(report.get_messages_by_hour_of_day(), 'hour', hours) for report in self._reports]
 
         title = 'Messages by Hour of Day'
         labels = self._names
 
-        xtick_pos = ( ind - width/2)
-        xtick_labels = range(24)
+        xtick_labels = list(range(24))
+
+        return dict(kind='grouped_bar', num_values=num_values, group_width=group_width, figsize=figsize, values=values,
+                    title=title, labels=labels, xtick_labels=xtick_labels, save_file=file_path)
+
+    def get_chart_specs(self, file_paths):
+        """
+        Get the specs of all charts, in the order: messages pie, words pie, month bars, weekday bars, hour bars.
+
+        Args:
+            file_paths (list of str): File to save every chart to
+
+        Returns:
+            list of dict: Picklable chart specs, see render_chart
+        """
+        spec_getters = [self.get_num_messages_pie_spec, self.get_num_words_pie_spec, self.get_messages_by_month_bar_spec,
+                        self.get_messages_by_weekday_bar_spec, self.get_messages_by_hour_bar_spec]
+
+        with stage('Plots.get_chart_specs', sum(report.get_number_of_messages() for report in self._reports)):
+            return [get_spec(file_path) for get_spec, file_path in zip(spec_getters, file_paths)]
+
+    def pie_chart_num_messages(self, file_path=None, display_plot=False):
+        self.render_chart(self.get_num_messages_pie_spec(file_path), display_plot)
+
+    def pie_chart_num_words(self, file_path=None, display_plot=False):
+        self.render_chart(self.get_num_words_pie_spec(file_path), display_plot)
+
+    def bar_chart_messages_by_weekday(self, file_path=None, display_plot=False):
+        self.render_chart(self.get_messages_by_weekday_bar_spec(file_path), display_plot)
+
+    def bar_chart_messages_by_month(self, file_path=None, display_plot=False):
+        self.render_chart(self.get_messages_by_month_bar_spec(file_path), display_plot)
+
+    def bar_chart_messages_by_hour(self, file_path=None, display_plot=False):
+        self.render_chart(self.get_messages_by_hour_bar_spec(file_path), display_plot)
+
+
+def _init_render_worker(font_size):
+    mpl.rcParams['font.size'] = font_size
+
+
+def _render_headless(spec):
+    # A figure made without pyplot needs no GUI backend and is freed once saved
+    with stage('Plots.render_chart') as record:
+        record['chart'] = spec['title']
+
+        fig = Figure(figsize=spec['figsize'])
+        Plots.draw_chart(fig.add_subplot(1, 1, 1), spec)
+        fig.savefig(spec['save_file'])
+
+    return spec['save_file']
+
+
+def get_chart_key(spec, font_size):
+    """
+    Get the result cache key of a chart, from everything drawn but the file it is saved to.
+    """
+    return get_result_key('chart', font_size, sorted((name, value) for name, value in spec.items() if name != 'save_file'))
+
+
+def _render_specs(specs, num_workers, font_size):
+    # No more processes than charts, every worker imports matplotlib
+    num_workers = min(num_workers or os.cpu_count(), len(specs))
+
+    if num_workers <= 1:
+        # The style only applies to these charts, the caller's is left as it was
+        with mpl.rc_context({'font.size': font_size}):
+            for spec in specs:
+                _render_headless(spec)
+
+        return
+
+    with multiprocessing.Pool(num_workers, initializer=_init_render_worker, initargs=(font_size,)) as pool:
+        pool.map(_render_headless, specs)
+
+
+def render_charts(specs, num_workers=RENDER_NUM_WORKERS, font_size=20.0, result_cache=None):
+    """
+    Render charts to their files in a pool of processes, with figures made without pyplot so that no GUI backend is
+    used. Rendering in this process leaves its backend and style as they were.
+
+    Args:
+        specs (list of dict): Chart specs with a save_file, e.g. from Plots.get_chart_specs
+        num_workers (int): Number of processes, at most one per chart. None uses all cores, 1 renders in this process
+        font_size (float): Font size of all charts
+        result_cache (ResultCache): Cache of rendered charts. Charts drawn before with the same values are copied from
+            it instead of rendered. Every chart is rendered if None
+
+    Returns:
+        list of str: Files written, in the order of specs
+    """
+    with stage('plots.render_charts', len(specs)) as record:
+        if result_cache is None:
+            pending = [(None, spec) for spec in specs]
+        else:
+            keys = [get_chart_key(spec, font_size) for spec in specs]
+            pending = [(key, spec) for key, spec in zip(keys, specs) if not result_cache.load_file(key, spec['save_file'])]
+
+        record['rendered'] = len(pending)
+        _render_specs([spec for _, spec in pending], num_workers, font_size)
+
+        if result_cache is not None:
+            for key, spec in pending:
+                result_cache.store_file(key, spec['save_file'])
 
-        self.side_by_side_bar_chart(num_values, width, figsize, values_one, values_two, title, labels, xtick_pos,
-                                    xtick_labels, display_plot=display_plot, save_file=file_path)
+        return [spec['save_file'] for spec in specs]
@@ -0,0 +1,99 @@
+from chat_messages.config import SENDER_COL, DATETIME_COL, REPLY_MAX_LATENCY_SECONDS, REPLY_PERCENTILES
+from chat_messages.store import sort_by_time
+from chat_messages.time_utils import get_time_features
+
+import pandas as pd
+import numpy as np
+
+
+REPLIED_TO_COL = 'replied_to'
+LATENCY_COL = 'latency'
+
+# Upper edges of the latency histogram, in seconds
+LATENCY_BINS = [60, 5 * 60, 15 * 60, 60 * 60, 3 * 60 * 60, 12 * 60 * 60]
+LATENCY_BIN_LABELS = ['< 1 min', '1-5 min', '5-15 min', '15-60 min', '1-3 h', '3-12 h', '> 12 h']
+
+
+def get_replies(messages_df, max_latency=REPLY_MAX_LATENCY_SECONDS):
+    """
+    Find replies with array diffs over the time-sorted messages. A message is a reply when the previous message is
+    from someone else, its latency is the time since that message.
+
+    Args:
+        messages_df (pd.DataFrame): Messages of all senders, e.g. from get_messages_dataframe
+        max_latency (float): Messages later than this many seconds start a new conversation and are not replies. No
+            limit if None
+
+    Returns:
+        pd.DataFrame: Sender, sender replied to, datetime, latency in seconds, hour and weekday of every reply
+    """
+    messages_df = sort_by_time(messages_df)
+    senders = messages_df[SENDER_COL].astype('category')
+    sender_codes = senders.cat.codes.to_numpy()
+    datetimes = messages_df[DATETIME_COL].to_numpy(dtype='datetime64[ns]')
+
+    latencies = np.diff(datetimes.view(np.int64)) / 1e9
+    is_reply = sender_codes[1:] != sender_codes[:-1]
+
+    if max_latency is not None:
+        is_reply &= latencies <= max_latency
+
+    # Replies are messages 1..n, answering messages 0..n-1
+    reply_idx = np.flatnonzero(is_reply)
+    categories = senders.cat.categories
+    reply_datetimes = pd.Series(datetimes[reply_idx + 1])
+    time_features = get_time_features(reply_datetimes)
+
+    return pd.DataFrame({SENDER_COL: pd.Categorical.from_codes(sender_codes[reply_idx + 1], categories),
+                         REPLIED_TO_COL: pd.Categorical.from_codes(sender_codes[reply_idx], categories),
+                         DATETIME_COL: reply_datetimes,
+                         LATENCY_COL: latencies[reply_idx],
+                         'hour': time_features['hour'],
+                         'weekday': time_features['weekday']})
+
+
+def get_latency_stats(replies, by=(SENDER_COL,), percentiles=REPLY_PERCENTILES):
+    """
+    Get the number of replies, mean and percentile latencies by groups of replies.
+
+    Args:
+        replies (pd.DataFrame): Replies from get_replies
+        by (list of str): Columns to group by, e.g. sender, replied_to, hour and weekday
+        percentiles (list of int): Percentiles of the latency to get, 50 is the median
+
+    Returns:
+        pd.DataFrame: Group columns, replies, mean and one p<percentile> column per percentile, latencies in seconds
+    """
+    by = list(by)
+    latencies = replies.groupby(by, observed=True, sort=True)[LATENCY_COL]
+
+    stats = latencies.agg(['count', 'mean']).rename(columns={'count': 'replies'})
+    quantile_levels = [percentile / 100.0 for percentile in percentiles]
+
+    # Columns by quantile, so that no replies still gives every percentile column
+    quantiles = latencies.quantile(quantile_levels).unstack().reindex(columns=quantile_levels)
+    quantiles.columns = ['p{}'.format(percentile) for percentile in percentiles]
+
+    return stats.join(quantiles).reset_index()
+
+
+def get_latency_histogram(replies, by=(SENDER_COL,), bins=LATENCY_BINS, labels=LATENCY_BIN_LABELS):
+    """
+    Get the distribution of reply latencies as counts per latency bin.
+
+    Args:
+        replies (pd.DataFrame): Replies from get_replies
+        by (list of str): Columns to group by
+        bins (list of float): Upper edges of the bins in seconds, the last bin has no upper edge
+        labels (list of str): Label of every bin, one more than bins
+
+    Returns:
+        pd.DataFrame: One row per group, one column of counts per bin in order of labels
+    """
+    bin_codes = np.searchsorted(np.asarray(bins, dtype=np.float64), replies[LATENCY_COL].to_numpy(), side='right')
+    latency_bins = pd.Categorical.from_codes(bin_codes, labels, ordered=True)
+
+    counts = replies.groupby(list(by) + [pd.Series(latency_bins, index=replies.index, name='latency_bin')],
+                             observed=False, sort=True).size()
+
+    return counts.unstack('latency_bin', fill_value=0).reset_index()
@@ -1,111 +1,137 @@
-from chat_messages.config import PROCESSED_MESSAGES_PATH, CSV_SEP, REPORT_START_DATE, REPORT_END_DATE, DATETIME_COL, TEXT_COL
+from chat_messages.config import PROCESSED_MESSAGES_PATH, CSV_SEP, REPORT_START_DATE, REPORT_END_DATE, SENDER_COL, DATETIME_COL, TEXT_COL
+from chat_messages.store import get_messages_dataframe, slice_by_time
+from chat_messages.time_utils import WEEKDAYS, get_time_features, get_messages_time_features, get_day_keys, format_day_key, format_month_key, parse_day_key
+from chat_messages.aggregates import MessageCube
+from chat_messages.tokens import TokenIndex
+from chat_messages.emojis import EmojiIndex, get_emoji_keys
+from chat_messages.sessions import SessionTable
+from chat_messages.memo import StatisticsCache, memoized
+from chat_messages.results import get_result_key
+from chat_messages.metrics import stage
 
 import pandas as pd
-from dateutil import parser
-from collections import Counter
-import operator
-import emoji
-import matplotlib.pyplot as plt
-import matplotlib as mpl
 import numpy as np
+import hashlib
+import abc
 
 
-mpl.rcParams['font.size'] = 20.0
+def get_messages_df_by_sender(messages_df, sender):
+    return messages_df[messages_df['sender'] == sender]
 
 
-def get_messages_dataframe(messages_file_path, separator, start_date, end_date):
-    messages = pd.read_csv(messages_file_path, separator)
-    messages[DATETIME_COL] = messages[DATETIME_COL].apply(lambda date_str: parser.parse(date_str))
+def get_reports_by_sender(messages_df, senders=None, result_cache=None):
+    """
+    Build a Report for every sender, partitioning the messages in one grouped pass and sharing one message cube and one
+    session table of all senders between the reports.
 
-    messages = messages[(messages[DATETIME_COL] >= start_date) & (messages[DATETIME_COL] <= end_date)]
+    Args:
+        messages_df (pd.DataFrame): Messages of all senders
+        senders (list of str): Senders to report on, in this order. All senders, in order of appearance, if None
+        result_cache (ResultCache): Cache to keep the statistics of the reports in between runs. Not kept if None
 
-    return messages[['sender', 'datetime', 'processed_text']]
+    Returns:
+        list of Report: Report of every sender
+    """
+    with stage('report.get_reports_by_sender', len(messages_df)):
+        cube = MessageCube(messages_df)
+        sessions = SessionTable(messages_df)
+        reports = dict()
 
+        for sender, sender_messages_df in messages_df.groupby(SENDER_COL, observed=True, sort=False):
+            if senders is None or sender in senders:
+                reports[sender] = Report(sender_messages_df, sender, cube=cube, sessions=sessions, result_cache=result_cache)
 
-def get_messages_df_by_sender(messages_df, sender):
-    return messages_df[messages_df['sender'] == sender]
+    if senders is None:
+        return list(reports.values())
 
+    return [reports[sender] if sender in reports else Report(messages_df.iloc[:0], sender, result_cache=result_cache) for sender in senders]
 
-class Report(object):
+
+class BaseReport(abc.ABC):
     """
-    Class to maintain messages dataframe of a person and report relevant statistics.
+    Statistics of a person shared by every kind of report: counts, totals, most active day, pictures and frequent words
+    and emojis. They are all read from a message cube and a few per-sender counts, which subclasses provide from
+    messages (Report) or from partial statistics (summary.SummaryReport).
+
+    Statistics are computed on first use and cached until the messages change. Cached results are shared between
+    calls and should not be modified. With a result cache, the statistics which only depend on the person's messages
+    are also kept on disk, see memo.memoized.
     """
 
-    def __init__(self, messages_df, sender):
+    def __init__(self, sender, result_cache=None):
         """
-        Constructor to read pandas dataframe of messages sent by a person
-
         Args:
-            messages_df (pd.DataFrame): Dataframe of messages and timestamps by a person
             sender (str): Name of the sender
+            result_cache (ResultCache): Cache to keep statistics in between runs. Not kept if None
         """
-        self._messages_df = messages_df
         self._sender = sender
-        self._messages = self.get_messages()
-        self._words = self.get_words()
-
-    def get_name(self):
-        return self._sender
+        self._statistics_cache = StatisticsCache()
+        self._result_cache = result_cache
 
-    def get_messages(self):
+    @abc.abstractmethod
+    def get_cube(self):
         """
-        Get list of messages sent by the person.
+        Get counts of messages and words by date and hour, from which all bucketed counts and totals are read.
 
         Returns:
-            list of str: List of all messages sent by the person
-
+            MessageCube: Aggregated counts of the messages
         """
-        return self._messages_df[TEXT_COL].tolist()
 
-    def get_words(self):
+    @abc.abstractmethod
+    def get_number_of_pictures_sent(self):
         """
-        Get concatenated list of all words in all messages sent by the person.
+        Return total number of images sent by person.
 
         Returns:
-            list of str: List of all words in all messages
+            int: Total number of messages which were images
         """
-        words = list()
-
-        for message in self._messages:
-            message_words = str(message).split(' ')
-            words.extend(message_words)
-
-        return words
 
-    def get_words_per_message(self):
+    @abc.abstractmethod
+    def get_frequent_words(self):
         """
-        Return average words per message.
+        Get most frequent words used by the person.
 
         Returns:
-            float: Average length of a message
+            list of tuples: Sorted list of words and frequencies in descending order
         """
-        lengths_of_messages = [len(str(message).split(' ')) for message in self._messages]
 
-        return float(sum(lengths_of_messages)) / len(self._messages)
-
-    def get_number_of_pictures_sent(self):
+    @abc.abstractmethod
+    def get_frequent_emojis(self):
         """
-        Return total number of images sent by person.
+        Get most frequent emojis used by the person.
 
         Returns:
-            int: Total number of messages which were images
+            list of tuples: Sorted list of emojis and frequencies in descending order
         """
-        photo_messages = [message for message in self._messages if str(message).strip() == '[[photo]]']
 
-        return len(photo_messages)
+    def get_name(self):
+        return self._sender
+
+    def _count_messages_by(self, bucket, format_key):
+        counts = self.get_cube().get_counts(bucket)
+        counts.index = [format_key(key) for key in counts.index]
 
-    def get_frequent_words(self):
+        return counts.rename(TEXT_COL).rename_axis(bucket).reset_index()
+
+    @memoized('get_cube', persist=True)
+    def get_number_of_messages(self):
+        return self.get_cube().get_total('rows')
+
+    @memoized('get_cube', persist=True)
+    def get_number_of_words(self):
+        return self.get_cube().get_total('words')
+
+    @memoized('get_number_of_words', 'get_number_of_messages')
+    def get_words_per_message(self):
         """
-        Get most frequent words used by the person.
+        Return average words per message.
 
         Returns:
-            list of tuples: Sorted list of words and frequencies in descending order
+            float: Average length of a message
         """
-        word_counts = Counter(self._words)
-        sorted_word_counts = sorted(word_counts.items(), key=operator.itemgetter(1), reverse=True)
-
-        return sorted_word_counts
+        return float(self.get_number_of_words()) / self.get_number_of_messages()
 
+    @memoized('get_cube', persist=True)
     def get_messages_by_weekday(self):
         """
         Get number of messages sent by weekday.
@@ -113,10 +139,12 @@ class Report(object):
         Returns:
             pd.DataFrame: DataFrame with columns as weekdays and number of messages sent
         """
-        self._messages_df['weekday'] = self._messages_df[DATETIME_COL].apply(lambda dt: dt.strftime("%A"))
+        weekday_counts = self._count_messages_by('weekday', WEEKDAYS.__getitem__)
 
-        return self._messages_df.groupby('weekday')[TEXT_COL].count().reset_index()
+        # Weekdays in alphabetical order, as expected by the plots
+        return weekday_counts.sort_values('weekday').reset_index(drop=True)
 
+    @memoized('get_cube', persist=True)
     def get_messages_by_date(self):
         """
         Get number of messages sent by date.
@@ -124,10 +152,9 @@ class Report(object):
         Returns:
             pd.DataFrame: DataFrame with columns as dates and number of messages sent
         """
-        self._messages_df['date'] = self._messages_df[DATETIME_COL].apply(lambda dt: dt.strftime("%Y-%m-%d"))
-
-        return self._messages_df.groupby('date')[TEXT_COL].count().reset_index()
+        return self._count_messages_by('date', format_day_key)
 
+    @memoized('get_cube', persist=True)
     def get_messages_by_month(self):
         """
         Get number of messages sent by month.
@@ -135,10 +162,9 @@ class Report(object):
         Returns:
             pd.DataFrame: DataFrame with columns as months and number of messages sent
         """
-        self._messages_df['month'] = self._messages_df[DATETIME_COL].apply(lambda dt: dt.strftime("%Y-%m"))
-
-        return self._messages_df.groupby('month')[TEXT_COL].count().reset_index()
+        return self._count_messages_by('month', format_month_key)
 
+    @memoized('get_cube', persist=True)
     def get_messages_by_hour_of_day(self):
         """
         Get number of messages sent by hour of day.
@@ -146,30 +172,202 @@ class Report(object):
         Returns:
             pd.DataFrame: DataFrame with columns as hour of day and number of messages sent
         """
-        self._messages_df['hour'] = self._messages_df[DATETIME_COL].apply(lambda dt: dt.strftime("%H"))
+        return self._count_messages_by('hour', '{:02d}'.format)
 
-        return self._messages_df.groupby('hour')[TEXT_COL].count().reset_index()
+    @memoized('get_messages_by_date', persist=True)
+    def get_most_active_day(self):
+        date_messages = self.get_messages_by_date()
+        max_date_message_count = max(date_messages[TEXT_COL].tolist())
 
-    def get_frequent_emojis(self):
+        max_date_rows = date_messages[date_messages[TEXT_COL] == max_date_message_count]
+        return max_date_rows.iloc[0]['date']
+
+
+class Report(BaseReport):
+    """
+    Class to maintain messages dataframe of a person and report relevant statistics.
+
+    Statistics are computed on first use and cached until the messages or the date window change. Cached results are
+    shared between calls and should not be modified. With a result cache, the statistics which only depend on the
+    person's messages in the window are also kept on disk, keyed by the content of those messages, and read back by
+    any later report on the same messages.
+    """
+
+    def __init__(self, messages_df, sender, start_date=None, end_date=None, cube=None, sessions=None, result_cache=None):
+        """
+        Constructor to read pandas dataframe of messages sent by a person
+
+        Args:
+            messages_df (pd.DataFrame): Dataframe of messages and timestamps by a person
+            sender (str): Name of the sender
+            start_date (datetime): Only report on messages sent at or after this time. No limit if None
+            end_date (datetime): Only report on messages sent at or before this time. No limit if None
+            cube (MessageCube): Counts of the messages of all senders, already computed, to read this sender's from
+            sessions (SessionTable): Conversations of all senders. Without it, sessions only see this sender's messages
+            result_cache (ResultCache): Cache to keep statistics in between runs. Not kept if None
+        """
+        super(Report, self).__init__(sender, result_cache)
+        self._messages_df = messages_df
+        self._date_window = (start_date, end_date)
+        self._shared_cube = cube
+        self._shared_sessions = sessions
+
+    def _get_metrics_rows(self):
+        return len(self._messages_df)
+
+    def set_messages_df(self, messages_df):
+        self._messages_df = messages_df
+        self._shared_cube = None
+        self._shared_sessions = None
+        self._statistics_cache.invalidate('messages')
+
+    def get_date_window(self):
+        return self._date_window
+
+    def set_date_window(self, start_date=None, end_date=None):
+        if (start_date, end_date) != self._date_window:
+            self._date_window = (start_date, end_date)
+            self._shared_cube = None
+            self._statistics_cache.invalidate('window')
+
+    @memoized('messages', 'window')
+    def get_messages_df(self):
+        """
+        Get the messages within the date window.
+
+        Returns:
+            pd.DataFrame: Messages reported on
+        """
+        start_date, end_date = self._date_window
+        messages_df = self._messages_df
+
+        if messages_df[DATETIME_COL].is_monotonic_increasing:
+            return slice_by_time(messages_df, start_date, end_date)
+
+        if start_date is not None:
+            messages_df = messages_df[messages_df[DATETIME_COL] >= start_date]
+        if end_date is not None:
+            messages_df = messages_df[messages_df[DATETIME_COL] <= end_date]
+
+        return messages_df
+
+    @memoized('get_messages_df')
+    def _get_result_key(self):
+        # Digest of the sender, the date window and every reported message, the identity of persisted statistics
+        messages_df = self.get_messages_df()
+        row_hashes = pd.util.hash_pandas_object(messages_df[[DATETIME_COL, TEXT_COL]], index=False).to_numpy()
+
+        return get_result_key(self._sender, self._date_window, len(messages_df), hashlib.sha256(row_hashes.tobytes()).hexdigest())
+
+    @memoized('get_messages_df')
+    def get_time_features(self):
+        """
+        Get calendar features of the messages.
+
+        Returns:
+            pd.DataFrame: Integer year, month, date, hour, minute, second and categorical weekday columns
+        """
+        return get_messages_time_features(self.get_messages_df(), DATETIME_COL)
+
+    @memoized('get_messages_df', 'get_time_features')
+    def get_cube(self):
+        """
+        Get counts of messages and words by date and hour, from which all bucketed counts and totals are read.
+
+        Returns:
+            MessageCube: Aggregated counts of the messages
+        """
+        if self._shared_cube is not None and self._date_window == (None, None):
+            return self._shared_cube.get_sender_cube(self._sender)
+
+        return MessageCube(self.get_messages_df(), time_features=self.get_time_features())
+
+    @memoized('get_messages_df')
+    def get_token_index(self):
+        """
+        Get the words of all messages as integer ids.
+
+        Returns:
+            TokenIndex: Tokenized messages
+        """
+        return TokenIndex(self.get_messages_df()[TEXT_COL])
+
+    @memoized('get_messages_df')
+    def get_emoji_index(self):
+        """
+        Get the emojis of all messages as integer ids, multi-codepoint emojis kept whole.
+
+        Returns:
+            EmojiIndex: Emojis of every message
+        """
+        return EmojiIndex(self.get_messages_df()[TEXT_COL])
+
+    @memoized('get_messages_df')
+    def get_messages(self):
+        """
+        Get list of messages sent by the person.
+
+        Returns:
+            list of str: List of all messages sent by the person
+
+        """
+        return self.get_messages_df()[TEXT_COL].tolist()
+
+    @memoized('get_token_index')
+    def get_words(self):
+        """
+        Get concatenated list of all words in all messages sent by the person. Builds a list of every word, use
+        get_number_of_words or get_token_index for statistics.
+
+        Returns:
+            list of str: List of all words in all messages
+        """
+        return self.get_token_index().get_words()
+
+    @memoized('get_messages_df', persist=True)
+    def get_number_of_pictures_sent(self):
+        """
+        Return total number of images sent by person.
+
+        Returns:
+            int: Total number of messages which were images
+        """
+        return int((self.get_messages_df()[TEXT_COL].str.strip() == '[[photo]]').sum())
+
+    @memoized('get_token_index', persist=True)
+    def get_frequent_words(self):
         """
         Get most frequent words used by the person.
 
         Returns:
             list of tuples: Sorted list of words and frequencies in descending order
         """
-        emojis = [word for word in self._words if word in emoji.UNICODE_EMOJI]
-        emoji_counts = Counter(emojis)
-        sorted_emoji_counts = sorted(emoji_counts.items(), key=operator.itemgetter(1), reverse=True)
+        return self.get_token_index().get_frequent_words()
 
-        return sorted_emoji_counts
+    @memoized('get_emoji_index', persist=True)
+    def get_frequent_emojis(self):
+        """
+        Get most frequent emojis used by the person.
 
-    def get_most_active_day(self):
-        date_messages = self.get_messages_by_date()
-        max_date_message_count = max(date_messages[TEXT_COL].tolist())
+        Returns:
+            list of tuples: Sorted list of emojis and frequencies in descending order
+        """
+        return self.get_emoji_index().get_frequent_emojis()
 
-        max_date_rows = date_messages[date_messages[TEXT_COL] == max_date_message_count]
-        return max_date_rows.iloc[0]['date']
+    @memoized('get_emoji_index', 'get_time_features', persist=True)
+    def get_emojis_by(self, bucket):
+        """
+        Get number of times every emoji was used by period.
 
+        Args:
+            bucket (str): 'year', 'month', 'weekday' or 'hour'
+
+        Returns:
+            pd.DataFrame: DataFrame with columns bucket, emoji and count, by decreasing count within a period
+        """
+        return self.get_emoji_index().get_counts_by(get_emoji_keys(self.get_messages_df(), [bucket], self.get_time_features()))
+
+    @memoized('get_messages_df', 'get_time_features')
     def get_messages_on_day(self, date_str):
         """
         Get dataframe of messages on a particular date.
@@ -180,23 +378,103 @@ class Report(object):
         Returns:
             pd.DataFrame: Table of messages on a particular date
         """
-        return self._messages_df[self._messages_df['date'] == date_str][[DATETIME_COL, TEXT_COL]]
+        is_on_day = get_day_keys(self.get_time_features()) == parse_day_key(date_str)
+
+        return self.get_messages_df()[is_on_day][[DATETIME_COL, TEXT_COL]]
+
+    @memoized('get_messages_df')
+    def get_sessions(self):
+        """
+        Get the conversations the person wrote in, starting within the date window.
+
+        Returns:
+            pd.DataFrame: Id, start, end, duration in seconds, number of messages, initiator and number of messages by
+                the person of every session
+        """
+        if self._shared_sessions is not None:
+            start_date, end_date = self._date_window
+
+            return self._shared_sessions.get_sender_sessions_df(self._sender, start_date, end_date)
+
+        return SessionTable(self.get_messages_df()).get_sender_sessions_df(self._sender)
+
+    @memoized('get_sessions')
+    def get_number_of_sessions(self):
+        return len(self.get_sessions())
+
+    @memoized('get_sessions')
+    def get_number_of_sessions_started(self):
+        return int((self.get_sessions()['initiator'] == self._sender).sum())
+
+    @memoized('get_number_of_sessions', 'get_number_of_sessions_started')
+    def get_sessions_started_share(self):
+        """
+        Get the share of conversations started by the person, among those the person wrote in.
+        """
+        if not self.get_number_of_sessions():
+            return 0.0
+
+        return float(self.get_number_of_sessions_started()) / self.get_number_of_sessions()
+
+    @memoized('get_sessions')
+    def get_average_session_messages(self):
+        sessions = self.get_sessions()
+
+        return float(sessions['messages'].mean()) if len(sessions) else 0.0
+
+    @memoized('get_sessions')
+    def get_average_session_duration(self):
+        """
+        Get the average duration of conversations, in seconds.
+        """
+        sessions = self.get_sessions()
+
+        return float(sessions['duration'].mean()) if len(sessions) else 0.0
+
+    @memoized('get_sessions')
+    def get_sessions_by_date(self):
+        """
+        Get number of conversations started by date.
+
+        Returns:
+            pd.DataFrame: DataFrame with columns as dates and number of sessions
+        """
+        day_keys = get_day_keys(get_time_features(self.get_sessions()['start']))
+        counts = day_keys.value_counts().sort_index()
+
+        return pd.DataFrame({'date': [format_day_key(day_key) for day_key in counts.index], 'sessions': counts.to_numpy()})
+
+    @memoized('get_sessions')
+    def get_sessions_per_day(self):
+        """
+        Get the average number of conversations per day, over the days from the first to the last conversation.
+        """
+        starts = self.get_sessions()['start']
+
+        if not len(starts):
+            return 0.0
+
+        num_days = (starts.iloc[-1].normalize() - starts.iloc[0].normalize()).days + 1
+
+        return float(len(starts)) / num_days
 
 
 def main():
+    # Only needed for the charts, kept out of imports of this module
+    import matplotlib.pyplot as plt
+    import matplotlib as mpl
+
+    mpl.rcParams['font.size'] = 20.0
+
     messages_df = get_messages_dataframe(PROCESSED_MESSAGES_PATH, CSV_SEP, REPORT_START_DATE, REPORT_END_DATE)
     print(messages_df.head())
 
-    sravan_messages_df = messages_df[messages_df['sender'] == 'Sravan']
-    sravan_report = Report(sravan_messages_df, 'Sravan')
-
-    harsha_messages_df = messages_df[messages_df['sender'] == 'Harsha']
-    harsha_report = Report(harsha_messages_df, 'Harsha')
+    sravan_report, harsha_report = get_reports_by_sender(messages_df, ['Sravan', 'Harsha'])
     print('\n' + '=' * 80 + '\n')
 
     # Total Messages sent
-    print('Messages sent by Sravan: {}'.format(len(sravan_report.get_messages())))
-    print('Messages sent by Harsha: {}'.format(len(harsha_report.get_messages())))
+    print('Messages sent by Sravan: {}'.format(sravan_report.get_number_of_messages()))
+    print('Messages sent by Harsha: {}'.format(harsha_report.get_number_of_messages()))
     print('Total messages sent between {} and {}: {}'.format(REPORT_START_DATE, REPORT_END_DATE, len(messages_df)))
     print('\n' + '='*80 + '\n')
     # fig = plt.figure(figsize=(8, 8))
@@ -208,10 +486,10 @@ def main():
 
     # Words per message
     print('Words per message for Sravan: {}'.format(sravan_report.get_words_per_message()))
-    print('Total number of words sent by Sravan: {}\n'.format(len(sravan_report.get_words())))
+    print('Total number of words sent by Sravan: {}\n'.format(sravan_report.get_number_of_words()))
 
     print('Words per message for Harsha: {}'.format(harsha_report.get_words_per_message()))
-    print('Total number of words sent by Harsha: {}'.format(len(harsha_report.get_words())))
+    print('Total number of words sent by Harsha: {}'.format(harsha_report.get_number_of_words()))
     print('\n' + '=' * 80 + '\n')
 
     # Pictures sent
@@ -221,14 +499,14 @@ def main():
 
     # Most used words
     print('Top words used by Sravan:\n')
-    sravan_total_num_words = len(sravan_report.get_words())
+    sravan_total_num_words = sravan_report.get_number_of_words()
     for word, count in sravan_report.get_frequent_words()[:16]:
         if word[:2] != '[[':
             print('{} - {:02.1f}%'.format(word, 100.0 * float(count)/sravan_total_num_words))
     print('\n')
 
     print('Top words used by Harsha:\n')
-    harsha_total_num_words = len(harsha_report.get_words())
+    harsha_total_num_words = harsha_report.get_number_of_words()
     for word, count in harsha_report.get_frequent_words()[:15]:
         print('{} - {:02.1f}%'.format(word, 100.0 * float(count)/harsha_total_num_words))
     print('\n' + '=' * 80 + '\n')
@@ -352,7 +630,7 @@ def main():
 
     for emoj, count in harsha_report.get_frequent_emojis()[:10]:
         print("{}: {}".format(emoj, count))
-        harsha_emojis.append("{}".format(emoji))
+        harsha_emojis.append("{}".format(emoj))
         harsha_emoji_counts.append(count)
     print('\n' + '=' * 80 + '\n')
 
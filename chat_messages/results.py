@@ -0,0 +1,172 @@
+from chat_messages.config import RESULT_CACHE_MAX_MB
+
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+
+
+# Part of every key. Bump it when the statistics or charts computed by the code change, to ignore older results
+RESULT_CACHE_VERSION = 1
+
+RESULT_SUFFIX = '.pkl'
+
+
+def get_result_key(*parts):
+    """
+    Get the cache key of a result from everything it depends on.
+
+    Args:
+        parts: Strings, numbers, dates and containers of them with a repr which is stable between runs
+
+    Returns:
+        str: Hex digest of the parts
+    """
+    return hashlib.sha256(repr((RESULT_CACHE_VERSION,) + parts).encode('utf-8')).hexdigest()
+
+
+class ResultCache(object):
+    """
+    Content-addressed cache of computed tables and rendered files in a directory. Every entry is a file named after its
+    key, with its last use as modification time. Once the entries exceed max_mb, the least recently used ones are
+    deleted.
+    """
+
+    def __init__(self, cache_dir, max_mb=RESULT_CACHE_MAX_MB):
+        """
+        Args:
+            cache_dir (str): Directory of the entries, created if missing
+            max_mb (float): Maximum total size of the entries in MB
+        """
+        self._cache_dir = cache_dir
+        self._max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = None
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_path(self, key, suffix):
+        return os.path.join(self._cache_dir, key + suffix)
+
+    def _get_entries(self):
+        # Sizes and last uses of the entries by file name, read from the directory once
+        if self._entries is None:
+            self._entries = dict()
+
+            for entry in os.scandir(self._cache_dir):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    entry_stat = entry.stat()
+                    self._entries[entry.name] = (entry_stat.st_mtime_ns, entry_stat.st_size)
+
+        return self._entries
+
+    def _touch(self, path):
+        # Mark an entry as just used, if it exists
+        try:
+            os.utime(path)
+            path_stat = os.stat(path)
+        except OSError:
+            return False
+
+        self._get_entries()[os.path.basename(path)] = (path_stat.st_mtime_ns, path_stat.st_size)
+
+        return True
+
+    def _store(self, path, write):
+        # Write to a temporary file first, so that an interrupted write never leaves a truncated entry
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self._cache_dir, prefix='.')
+
+        try:
+            with os.fdopen(file_descriptor, 'wb') as temp_file:
+                write(temp_file)
+
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        path_stat = os.stat(path)
+        self._get_entries()[os.path.basename(path)] = (path_stat.st_mtime_ns, path_stat.st_size)
+        self.evict()
+
+    def get(self, key, compute):
+        """
+        Get a cached result, computing and storing it if missing.
+
+        Args:
+            key (str): Key of the result, see get_result_key
+            compute (function): Computes the result, which must be picklable
+
+        Returns:
+            object: The result
+        """
+        path = self._get_path(key, RESULT_SUFFIX)
+
+        if self._touch(path):
+            try:
+                with open(path, 'rb') as result_file:
+                    return pickle.load(result_file)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+
+        result = compute()
+        self._store(path, lambda result_file: pickle.dump(result, result_file, protocol=pickle.HIGHEST_PROTOCOL))
+
+        return result
+
+    def load_file(self, key, file_path):
+        """
+        Copy a cached file to file_path.
+
+        Returns:
+            bool: Whether the file was cached
+        """
+        path = self._get_path(key, os.path.splitext(file_path)[1])
+
+        if not self._touch(path):
+            return False
+
+        try:
+            shutil.copyfile(path, file_path)
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def store_file(self, key, file_path):
+        """
+        Cache a copy of file_path under key.
+        """
+        with open(file_path, 'rb') as source_file:
+            self._store(self._get_path(key, os.path.splitext(file_path)[1]),
+                        lambda result_file: shutil.copyfileobj(source_file, result_file))
+
+    def get_size_mb(self):
+        return sum(size for _, size in self._get_entries().values()) / 1024 / 1024
+
+    def evict(self):
+        """
+        Delete the least recently used entries until they fit in max_mb.
+        """
+        entries = self._get_entries()
+        total_bytes = sum(size for _, size in entries.values())
+
+        for file_name in sorted(entries, key=lambda name: entries[name][0]):
+            if total_bytes <= self._max_bytes:
+                break
+
+            total_bytes -= entries.pop(file_name)[1]
+
+            try:
+                os.remove(os.path.join(self._cache_dir, file_name))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for file_name in list(self._get_entries()):
+            try:
+                os.remove(os.path.join(self._cache_dir, file_name))
+            except FileNotFoundError:
+                pass
+
+        self._entries = dict()
@@ -0,0 +1,235 @@
+from chat_messages.config import SENDER_COL, TEXT_COL, DATETIME_COL
+from chat_messages.store import read_messages, sort_by_time, get_store_fingerprint
+from chat_messages.tokens import TokenIndex
+from chat_messages.text_utils import normalize_text
+
+import pandas as pd
+import numpy as np
+import os
+
+
+INDEX_SUFFIX = '.index.npz'
+
+# Separates the strings of the vocabulary and of the senders on disk. Words never contain it
+STRINGS_SEP = '\x00'
+
+
+def get_index_path(store_path):
+    return store_path + INDEX_SUFFIX
+
+
+def _encode_strings(strings):
+    return np.frombuffer(STRINGS_SEP.join(strings).encode('utf-8'), dtype=np.uint8)
+
+
+def _decode_strings(encoded):
+    strings = encoded.tobytes().decode('utf-8')
+
+    return strings.split(STRINGS_SEP) if strings else []
+
+
+class MessageIndex(object):
+    """
+    Inverted index of processed messages. Messages are identified by their position in time order and every word has a
+    posting list of the sorted ids of the messages containing it, so word and phrase queries restricted to a sender
+    and a date range only touch the postings of the query words.
+    """
+
+    def __init__(self, messages_df=None, arrays=None):
+        """
+        Constructor to index messages, or to wrap already built index arrays.
+
+        Args:
+            messages_df (pd.DataFrame): Messages sorted by time, with sender, datetime and processed text columns
+            arrays (dict): Index arrays, as returned by get_arrays
+        """
+        if arrays is None:
+            arrays = self._build(messages_df)
+
+        self._arrays = arrays
+        self._vocabulary = _decode_strings(arrays['vocabulary'])
+        self._word_ids = {word: word_id for word_id, word in enumerate(self._vocabulary)}
+        self._senders = _decode_strings(arrays['senders'])
+
+    @staticmethod
+    def _build(messages_df):
+        token_index = TokenIndex(messages_df[TEXT_COL])
+        tokens = token_index.get_tokens()
+        vocabulary = token_index.get_vocabulary()
+
+        # Tokens are in message order, so a stable sort by word keeps the message ids of every word sorted
+        message_ids = np.repeat(np.arange(token_index.get_number_of_messages(), dtype=np.int32), token_index.get_message_lengths())
+        order = np.argsort(tokens, kind='stable')
+        sorted_tokens = tokens[order]
+        sorted_message_ids = message_ids[order]
+
+        # A message is posted once per word, however often it contains it
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = (sorted_tokens[1:] != sorted_tokens[:-1]) | (sorted_message_ids[1:] != sorted_message_ids[:-1])
+
+        postings = sorted_message_ids[is_first]
+        posting_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        posting_offsets[1:] = np.cumsum(np.bincount(sorted_tokens[is_first], minlength=len(vocabulary)))
+
+        senders = messages_df[SENDER_COL].astype('category')
+        datetimes = messages_df[DATETIME_COL].to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+        return {'vocabulary': _encode_strings(vocabulary),
+                'tokens': tokens,
+                'offsets': token_index.get_offsets(),
+                'postings': postings,
+                'posting_offsets': posting_offsets,
+                'senders': _encode_strings([str(sender) for sender in senders.cat.categories]),
+                'sender_codes': senders.cat.codes.to_numpy(),
+                'datetimes': datetimes}
+
+    def get_arrays(self):
+        return self._arrays
+
+    def save(self, file_path, fingerprint=None):
+        arrays = dict(self._arrays)
+
+        if fingerprint is not None:
+            arrays['fingerprint'] = fingerprint
+
+        with open(file_path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, file_path, fingerprint=None):
+        """
+        Load a saved index.
+
+        Args:
+            file_path (str): File written by save
+            fingerprint (np.ndarray): Expected fingerprint of the indexed messages, see get_store_fingerprint
+
+        Returns:
+            MessageIndex: The index, or None if the file does not exist or the fingerprint differs
+        """
+        if not os.path.exists(file_path):
+            return None
+
+        with np.load(file_path) as saved:
+            arrays = {name: saved[name] for name in saved.files}
+
+        saved_fingerprint = arrays.pop('fingerprint', None)
+
+        if fingerprint is not None and (saved_fingerprint is None or not np.array_equal(saved_fingerprint, fingerprint)):
+            return None
+
+        return cls(arrays=arrays)
+
+    def get_postings(self, word):
+        """
+        Get the sorted ids of the messages containing a word.
+        """
+        word_id = self._word_ids.get(word)
+
+        if word_id is None:
+            return np.zeros(0, dtype=np.int32)
+
+        posting_offsets = self._arrays['posting_offsets']
+
+        return self._arrays['postings'][posting_offsets[word_id]:posting_offsets[word_id + 1]]
+
+    def _contains_phrase(self, message_id, word_ids):
+        offsets = self._arrays['offsets']
+        message_tokens = self._arrays['tokens'][offsets[message_id]:offsets[message_id + 1]].tolist()
+
+        return any(message_tokens[start:start + len(word_ids)] == word_ids for start in range(len(message_tokens) - len(word_ids) + 1))
+
+    def _get_id_range(self, start_date, end_date):
+        datetimes = self._arrays['datetimes']
+        first_id = 0 if start_date is None else np.searchsorted(datetimes, pd.Timestamp(start_date).value, side='left')
+        last_id = len(datetimes) if end_date is None else np.searchsorted(datetimes, pd.Timestamp(end_date).value, side='right')
+
+        return first_id, last_id
+
+    def _filter_sender(self, message_ids, sender):
+        if sender is None:
+            return message_ids
+
+        if sender not in self._senders:
+            return message_ids[:0]
+
+        return message_ids[self._arrays['sender_codes'][message_ids] == self._senders.index(sender)]
+
+    def search(self, query=None, sender=None, start_date=None, end_date=None):
+        """
+        Find messages containing all words of a query next to each other.
+
+        Args:
+            query (str): Word or phrase, normalized like the processed messages. All messages if None
+            sender (str): Only messages of this sender. Any sender if None
+            start_date (datetime): Only messages sent at or after this time. No limit if None
+            end_date (datetime): Only messages sent at or before this time. No limit if None
+
+        Returns:
+            np.ndarray: Ids of the matching messages, in time order
+        """
+        first_id, last_id = self._get_id_range(start_date, end_date)
+
+        if query is None:
+            return self._filter_sender(np.arange(first_id, last_id, dtype=np.int32), sender)
+
+        words = normalize_text(query).split(' ')
+
+        if any(word not in self._word_ids for word in words):
+            return np.zeros(0, dtype=np.int32)
+
+        # Narrow the shortest posting list to the date range by binary search, then intersect the others with it
+        postings = sorted([self.get_postings(word) for word in words], key=len)
+
+        message_ids = postings[0]
+        message_ids = message_ids[np.searchsorted(message_ids, first_id):np.searchsorted(message_ids, last_id)]
+
+        for word_postings in postings[1:]:
+            message_ids = np.intersect1d(message_ids, word_postings, assume_unique=True)
+
+        message_ids = self._filter_sender(message_ids, sender)
+
+        if len(words) > 1:
+            word_ids = [self._word_ids[word] for word in words]
+            message_ids = np.array([message_id for message_id in message_ids if self._contains_phrase(message_id, word_ids)], dtype=np.int32)
+
+        return message_ids
+
+    def get_messages_on_day(self, date_str, sender=None):
+        """
+        Find the messages sent on a date.
+
+        Args:
+            date_str (str): Date in 'YYYY-MM-DD' format
+            sender (str): Only messages of this sender. Any sender if None
+
+        Returns:
+            np.ndarray: Ids of the messages, in time order
+        """
+        day_start = pd.Timestamp(date_str)
+
+        return self.search(sender=sender, start_date=day_start, end_date=day_start + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns'))
+
+
+def get_message_index(store_path, messages_df=None):
+    """
+    Load the index saved next to a processed messages file, building and saving it if it is missing or stale.
+
+    Args:
+        store_path (str): Processed messages file
+        messages_df (pd.DataFrame): Messages of store_path sorted by time, if already loaded
+
+    Returns:
+        MessageIndex: Index of the messages, ids being positions in time order
+    """
+    fingerprint = get_store_fingerprint(store_path)
+    message_index = MessageIndex.load(get_index_path(store_path), fingerprint)
+
+    if message_index is None:
+        if messages_df is None:
+            messages_df = sort_by_time(read_messages(store_path, [SENDER_COL, DATETIME_COL, TEXT_COL]))
+
+        message_index = MessageIndex(messages_df)
+        message_index.save(get_index_path(store_path), fingerprint)
+
+    return message_index
@@ -0,0 +1,143 @@
+from chat_messages.config import SENDER_COL, DATETIME_COL, SESSION_GAP_SECONDS
+
+import pandas as pd
+import numpy as np
+
+
+SESSION_COLS = ['session_id', 'start', 'end', 'duration', 'messages', 'initiator']
+
+
+def get_session_starts(datetimes, gap=SESSION_GAP_SECONDS):
+    """
+    Flag the messages starting a session, the first message and every message later than gap after the previous one.
+
+    Args:
+        datetimes (pd.Series): Sorted datetime64 timestamps
+        gap (float): Inactivity gap in seconds
+
+    Returns:
+        np.ndarray: Boolean flag of every message
+    """
+    nanoseconds = datetimes.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    is_start = np.ones(len(nanoseconds), dtype=bool)
+    is_start[1:] = np.diff(nanoseconds) > gap * 10 ** 9
+
+    return is_start
+
+
+class SessionTable(object):
+    """
+    Conversations of a chat, split where nobody wrote for longer than an inactivity gap, found with one vectorized
+    pass over the time-sorted messages. Computed on first use, so it can be shared between reports at no cost until
+    a session statistic is needed.
+    """
+
+    def __init__(self, messages_df, gap=SESSION_GAP_SECONDS):
+        """
+        Args:
+            messages_df (pd.DataFrame): Messages of all senders with sender and datetime columns
+            gap (float): Inactivity gap in seconds
+        """
+        self._messages_df = messages_df
+        self._gap = gap
+        self._session_ids = None
+        self._sessions_df = None
+        self._sender_counts = None
+
+    def _split(self):
+        messages_df = self._messages_df
+        order = None
+
+        # Positions in order of time, keeping the order of messages sent at the same time
+        if not messages_df[DATETIME_COL].is_monotonic_increasing:
+            order = np.argsort(messages_df[DATETIME_COL].to_numpy(), kind='stable')
+            messages_df = messages_df.iloc[order]
+
+        senders = messages_df[SENDER_COL].astype('category')
+        sender_codes = senders.cat.codes.to_numpy().astype(np.int64)
+        datetimes = messages_df[DATETIME_COL]
+
+        is_start = get_session_starts(datetimes, self._gap)
+        session_ids = np.cumsum(is_start) - 1
+        first_idx = np.flatnonzero(is_start)
+        last_idx = np.append(first_idx[1:], len(is_start))[:len(first_idx)] - 1
+        num_sessions = len(first_idx)
+
+        starts = datetimes.iloc[first_idx].to_numpy()
+        ends = datetimes.iloc[last_idx].to_numpy()
+
+        self._sessions_df = pd.DataFrame({'session_id': np.arange(num_sessions),
+                                          'start': starts,
+                                          'end': ends,
+                                          'duration': (ends - starts) / np.timedelta64(1, 's'),
+                                          'messages': last_idx - first_idx + 1,
+                                          'initiator': pd.Categorical.from_codes(sender_codes[first_idx], senders.cat.categories)})
+
+        # Messages of every sender in every session, as one bincount over session and sender pairs
+        num_senders = len(senders.cat.categories)
+        counts = np.bincount(session_ids * num_senders + sender_codes, minlength=num_sessions * num_senders)
+        self._sender_counts = pd.DataFrame(counts.reshape(num_sessions, num_senders), columns=senders.cat.categories)
+
+        # In the order of the given messages
+        if order is not None:
+            session_ids[order] = session_ids.copy()
+
+        self._session_ids = session_ids
+
+    def get_session_ids(self):
+        """
+        Get the session id of every message, in the order of the given messages.
+        """
+        if self._session_ids is None:
+            self._split()
+
+        return self._session_ids
+
+    def get_sessions_df(self):
+        """
+        Get the sessions in order of time.
+
+        Returns:
+            pd.DataFrame: Id, start, end, duration in seconds, number of messages and initiator of every session
+        """
+        if self._sessions_df is None:
+            self._split()
+
+        return self._sessions_df
+
+    def get_sender_counts(self):
+        """
+        Get the number of messages of every sender in every session.
+
+        Returns:
+            pd.DataFrame: One row per session id, one column per sender
+        """
+        if self._sender_counts is None:
+            self._split()
+
+        return self._sender_counts
+
+    def get_sender_sessions_df(self, sender, start_date=None, end_date=None):
+        """
+        Get the sessions a sender wrote in, with the number of messages of the sender.
+
+        Args:
+            sender (str): Name of the sender
+            start_date (datetime): Only sessions starting at or after this time. No limit if None
+            end_date (datetime): Only sessions starting at or before this time. No limit if None
+
+        Returns:
+            pd.DataFrame: Sessions like get_sessions_df, with a sender_messages column
+        """
+        sessions_df = self.get_sessions_df()
+        sender_counts = self.get_sender_counts()
+        sender_messages = sender_counts[sender].to_numpy() if sender in sender_counts.columns else np.zeros(len(sessions_df), dtype=np.int64)
+
+        is_selected = sender_messages > 0
+
+        if start_date is not None:
+            is_selected &= (sessions_df['start'] >= pd.Timestamp(start_date)).to_numpy()
+        if end_date is not None:
+            is_selected &= (sessions_df['start'] <= pd.Timestamp(end_date)).to_numpy()
+
+        return sessions_df[is_selected].assign(sender_messages=sender_messages[is_selected]).reset_index(drop=True)
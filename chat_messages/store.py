@@ -0,0 +1,332 @@
+from chat_messages.config import CSV_SEP, SENDER_COL, TEXT_COL, DATETIME_COL, COMPACT_SCHEMA, PERSIST_DROPPED_COLS, OUT_OF_CORE_CHUNK_SIZE
+from chat_messages.time_utils import TIME_FEATURE_DTYPES
+
+import pandas as pd
+import numpy as np
+import shutil
+import os
+
+try:
+    import pyarrow
+    STRING_DTYPE = pd.StringDtype('pyarrow')
+except ImportError:
+    # Plain Python strings without pyarrow
+    STRING_DTYPE = np.dtype(object)
+
+
+# A path without extension is a directory of Parquet files, one per month
+STORE_FORMATS = {'.parquet': 'parquet', '.feather': 'feather', '.csv': 'csv', '': 'partitioned'}
+
+REPORT_COLS = [SENDER_COL, DATETIME_COL, TEXT_COL]
+PARTITION_PREFIX = 'month='
+PARTITION_FILE_NAME = 'part-0.parquet'
+STRING_COLS = ['time', 'text', TEXT_COL]
+
+
+def get_store_format(file_path):
+    """
+    Get the on-disk format of a processed messages file from its extension. Unknown extensions are read as CSV.
+    """
+    extension = os.path.splitext(file_path.rstrip(os.sep))[1].lower()
+
+    return STORE_FORMATS.get(extension, 'csv')
+
+
+def get_store_fingerprint(file_path):
+    """
+    Get size and latest modification time of a processed messages file or directory, to tell whether something
+    derived from it is stale.
+    """
+    if not os.path.isdir(file_path):
+        file_stat = os.stat(file_path)
+
+        return np.array([file_stat.st_size, file_stat.st_mtime_ns], dtype=np.int64)
+
+    file_stats = [os.stat(os.path.join(dir_path, file_name)) for dir_path, _, file_names in os.walk(file_path) for file_name in file_names]
+
+    return np.array([sum(file_stat.st_size for file_stat in file_stats),
+                     max([file_stat.st_mtime_ns for file_stat in file_stats] or [0])], dtype=np.int64)
+
+
+def get_compact_messages_df(messages_df, compact=COMPACT_SCHEMA):
+    """
+    Get messages with a lean schema. Senders are always categorical. The compact schema also makes weekdays
+    categorical, time parts small integers and texts Arrow backed strings.
+
+    Args:
+        messages_df (pd.DataFrame): Messages with any subset of the processed columns
+        compact (bool): Use the compact schema
+
+    Returns:
+        pd.DataFrame: Messages, not copied if they already have the schema
+    """
+    dtypes = {SENDER_COL: 'category'}
+
+    if compact:
+        dtypes.update(TIME_FEATURE_DTYPES)
+        dtypes.update({column: STRING_DTYPE for column in STRING_COLS})
+
+    changed_dtypes = {column: dtype for column, dtype in dtypes.items()
+                      if column in messages_df.columns and messages_df[column].dtype != dtype}
+
+    return messages_df.astype(changed_dtypes) if changed_dtypes else messages_df
+
+
+def get_persisted_messages_df(messages_df, dropped_cols=PERSIST_DROPPED_COLS):
+    """
+    Get messages as they are written to disk, without the dropped columns and with the lean schema.
+    """
+    return get_compact_messages_df(messages_df.drop(columns=[column for column in dropped_cols if column in messages_df.columns]))
+
+
+def sort_by_time(messages_df):
+    """
+    Get messages sorted by time, keeping the original order of messages sent at the same time.
+    """
+    if messages_df[DATETIME_COL].is_monotonic_increasing:
+        return messages_df
+
+    return messages_df.sort_values(DATETIME_COL, kind='stable')
+
+
+def slice_by_time(messages_df, start_date=None, end_date=None):
+    """
+    Get the messages sent between two times, both included, by binary search over messages sorted by time.
+
+    Args:
+        messages_df (pd.DataFrame): Messages sorted by time
+        start_date (datetime): Start of the window. No limit if None
+        end_date (datetime): End of the window. No limit if None
+
+    Returns:
+        pd.DataFrame: Positional slice of messages_df
+    """
+    # Nanoseconds on both sides, bounds finer than the unit of the column cannot be searched in it
+    nanoseconds = messages_df[DATETIME_COL].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    first_idx = 0 if start_date is None else np.searchsorted(nanoseconds, pd.Timestamp(start_date).value, side='left')
+    last_idx = len(messages_df) if end_date is None else np.searchsorted(nanoseconds, pd.Timestamp(end_date).value, side='right')
+
+    return messages_df.iloc[first_idx:last_idx]
+
+
+def _get_partition_month(dir_name):
+    return dir_name[len(PARTITION_PREFIX):]
+
+
+def _get_partition_dfs(messages_df):
+    datetimes = messages_df[DATETIME_COL]
+    month_keys = datetimes.dt.year * 100 + datetimes.dt.month
+
+    for month_key, month_df in messages_df.groupby(month_keys.to_numpy(), sort=True):
+        yield '{:04d}-{:02d}'.format(month_key // 100, month_key % 100), month_df
+
+
+def _get_partition_path(file_path, month):
+    return os.path.join(file_path, PARTITION_PREFIX + month, PARTITION_FILE_NAME)
+
+
+def _write_partition(month_df, file_path, month):
+    partition_path = _get_partition_path(file_path, month)
+
+    if not os.path.isdir(os.path.dirname(partition_path)):
+        os.makedirs(os.path.dirname(partition_path))
+
+    month_df.to_parquet(partition_path, index=False)
+
+
+def write_messages(messages_df, file_path, separator=CSV_SEP):
+    """
+    Write processed messages sorted by time, without PERSIST_DROPPED_COLS. Parquet and Feather keep native datetime64
+    timestamps and the compact schema, a partitioned store also splits them into one Parquet file per month.
+
+    Args:
+        messages_df (pd.DataFrame): Processed messages
+        file_path (str): Destination, its extension picks the format
+        separator (str): Field separator when writing CSV
+    """
+    store_format = get_store_format(file_path)
+    messages_df = sort_by_time(get_persisted_messages_df(messages_df))
+
+    if store_format == 'partitioned':
+        if os.path.isdir(file_path):
+            shutil.rmtree(file_path)
+
+        for month, month_df in _get_partition_dfs(messages_df):
+            _write_partition(month_df, file_path, month)
+    elif store_format == 'parquet':
+        messages_df.to_parquet(file_path, index=False)
+    elif store_format == 'feather':
+        messages_df.reset_index(drop=True).to_feather(file_path)
+    else:
+        messages_df.to_csv(file_path, sep=separator)
+
+
+def append_messages(messages_df, file_path, separator=CSV_SEP):
+    """
+    Append processed messages, which are not older than the stored ones, to a processed messages file. CSV is
+    appended in place, a partitioned store rewrites only the months appended to and other formats are rewritten.
+    """
+    store_format = get_store_format(file_path)
+
+    if store_format == 'csv':
+        # Keep the columns of the file, which may have been written with other dropped columns
+        columns = pd.read_csv(file_path, sep=separator, index_col=0, nrows=0).columns
+        messages_df = sort_by_time(get_persisted_messages_df(messages_df, dropped_cols=[]))
+        messages_df.reindex(columns=columns).to_csv(file_path, sep=separator, mode='a', header=False)
+    elif store_format == 'partitioned':
+        for month, month_df in _get_partition_dfs(messages_df):
+            if os.path.exists(_get_partition_path(file_path, month)):
+                month_df = pd.concat([pd.read_parquet(_get_partition_path(file_path, month)), month_df], ignore_index=True)
+
+            _write_partition(sort_by_time(get_persisted_messages_df(month_df)), file_path, month)
+    else:
+        write_messages(pd.concat([read_messages(file_path), messages_df], ignore_index=True), file_path)
+
+
+def _get_partition_months(file_path, start_date=None, end_date=None):
+    months = sorted(_get_partition_month(dir_name) for dir_name in os.listdir(file_path) if dir_name.startswith(PARTITION_PREFIX))
+
+    # Months overlapping the window. Rows are not filtered here
+    selected_months = [month for month in months
+                       if (start_date is None or month >= pd.Timestamp(start_date).strftime('%Y-%m')) and
+                       (end_date is None or month <= pd.Timestamp(end_date).strftime('%Y-%m'))]
+
+    return months, selected_months
+
+
+def _read_partitions(file_path, columns=None, start_date=None, end_date=None):
+    months, selected_months = _get_partition_months(file_path, start_date, end_date)
+
+    if not months:
+        return pd.DataFrame(columns=columns or [])
+
+    if not selected_months:
+        return pd.read_parquet(_get_partition_path(file_path, months[0]), columns=columns).iloc[:0]
+
+    return pd.concat([pd.read_parquet(_get_partition_path(file_path, month), columns=columns) for month in selected_months],
+                     ignore_index=True)
+
+
+def read_messages(file_path, columns=None, separator=CSV_SEP, start_date=None, end_date=None):
+    """
+    Read processed messages, loading only the requested columns.
+
+    Args:
+        file_path (str): Processed messages file, its extension picks the format
+        columns (list of str): Columns to load. All columns if None
+        separator (str): Field separator when reading CSV
+        start_date (datetime): For a partitioned store, skip months before this time
+        end_date (datetime): For a partitioned store, skip months after this time
+
+    Returns:
+        pd.DataFrame: Processed messages with datetime64 timestamps and the lean schema
+    """
+    store_format = get_store_format(file_path)
+
+    if store_format == 'partitioned':
+        messages = _read_partitions(file_path, columns, start_date, end_date)
+    elif store_format == 'parquet':
+        messages = pd.read_parquet(file_path, columns=columns)
+    elif store_format == 'feather':
+        messages = pd.read_feather(file_path, columns=columns)
+    else:
+        if columns is None:
+            messages = pd.read_csv(file_path, sep=separator, index_col=0).reset_index(drop=True)
+        else:
+            messages = pd.read_csv(file_path, sep=separator, usecols=lambda column: column in columns)[columns]
+
+        if DATETIME_COL in messages.columns:
+            messages[DATETIME_COL] = pd.to_datetime(messages[DATETIME_COL], format='ISO8601')
+
+    return get_compact_messages_df(messages)
+
+
+def _iter_arrow_chunks(record_batches, chunk_size):
+    for record_batch in record_batches:
+        for offset in range(0, record_batch.num_rows, chunk_size):
+            yield record_batch.slice(offset, chunk_size).to_pandas()
+
+
+def _iter_raw_chunks(file_path, chunk_size, columns, separator, start_date, end_date):
+    store_format = get_store_format(file_path)
+
+    if store_format in ('parquet', 'partitioned'):
+        import pyarrow.parquet as pq
+
+        if store_format == 'partitioned':
+            file_paths = [_get_partition_path(file_path, month) for month in _get_partition_months(file_path, start_date, end_date)[1]]
+        else:
+            file_paths = [file_path]
+
+        for parquet_path in file_paths:
+            for chunk in _iter_arrow_chunks(pq.ParquetFile(parquet_path).iter_batches(batch_size=chunk_size, columns=columns), chunk_size):
+                yield chunk
+    elif store_format == 'feather':
+        import pyarrow as pa
+
+        # Feather files are Arrow IPC files, written in record batches and read here memory-mapped
+        with pa.memory_map(file_path) as source:
+            reader = pa.ipc.open_file(source)
+            record_batches = (reader.get_batch(batch_idx) for batch_idx in range(reader.num_record_batches))
+
+            for chunk in _iter_arrow_chunks(record_batches, chunk_size):
+                yield chunk[columns] if columns is not None else chunk
+    else:
+        if columns is None:
+            chunks = pd.read_csv(file_path, sep=separator, index_col=0, chunksize=chunk_size)
+        else:
+            chunks = pd.read_csv(file_path, sep=separator, usecols=lambda column: column in columns, chunksize=chunk_size)
+
+        for chunk in chunks:
+            chunk = chunk.reset_index(drop=True) if columns is None else chunk[columns]
+
+            if DATETIME_COL in chunk.columns:
+                chunk[DATETIME_COL] = pd.to_datetime(chunk[DATETIME_COL], format='ISO8601')
+
+            yield chunk
+
+
+def iter_messages_chunks(file_path, chunk_size=OUT_OF_CORE_CHUNK_SIZE, columns=REPORT_COLS, separator=CSV_SEP, start_date=None, end_date=None):
+    """
+    Read processed messages a chunk of rows at a time, in the order they are stored, so that files larger than memory
+    can be processed.
+
+    Args:
+        file_path (str): Processed messages file, its extension picks the format
+        chunk_size (int): Maximum number of rows of a chunk
+        columns (list of str): Columns to load. All columns if None
+        separator (str): Field separator when reading CSV
+        start_date (datetime): Only messages sent at or after this time. No limit if None
+        end_date (datetime): Only messages sent at or before this time. No limit if None
+
+    Yields:
+        pd.DataFrame: Chunk of messages with datetime64 timestamps and the lean schema, never empty
+    """
+    for chunk in _iter_raw_chunks(file_path, chunk_size, columns, separator, start_date, end_date):
+        if start_date is not None:
+            chunk = chunk[chunk[DATETIME_COL] >= pd.Timestamp(start_date)]
+        if end_date is not None:
+            chunk = chunk[chunk[DATETIME_COL] <= pd.Timestamp(end_date)]
+
+        if len(chunk):
+            yield get_compact_messages_df(chunk.reset_index(drop=True))
+
+
+def get_messages_dataframe(messages_file_path, separator=CSV_SEP, start_date=None, end_date=None, columns=REPORT_COLS):
+    """
+    Read the processed messages sent between two times, both included.
+
+    Args:
+        messages_file_path (str): Processed messages file, its extension picks the format
+        separator (str): Field separator when reading CSV
+        start_date (datetime): Start of the window. No limit if None
+        end_date (datetime): End of the window. No limit if None
+        columns (list of str): Columns to load
+
+    Returns:
+        pd.DataFrame: Messages sorted by time
+    """
+    messages = read_messages(messages_file_path, columns, separator, start_date, end_date)
+
+    # Already sorted unless written by an older version
+    return slice_by_time(sort_by_time(messages), start_date, end_date)
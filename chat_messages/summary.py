@@ -0,0 +1,177 @@
+from chat_messages.config import PROCESSED_MESSAGES_PATH, CSV_SEP, SENDER_COL, TEXT_COL, OUT_OF_CORE_CHUNK_SIZE
+from chat_messages.store import iter_messages_chunks
+from chat_messages.aggregates import CUBE_KEY_COLS, CUBE_VALUE_COLS, MessageCube, merge_cubes
+from chat_messages.tokens import TokenIndex
+from chat_messages.emojis import EmojiIndex
+from chat_messages.report import BaseReport
+from chat_messages.memo import memoized
+from chat_messages.metrics import stage
+
+import pandas as pd
+
+
+def _merge_counts(counts, other_counts):
+    # Words new to counts are appended, keeping the order of first appearance
+    for key, count in other_counts.items():
+        counts[key] = counts.get(key, 0) + count
+
+
+def _get_frequent(counts):
+    # Stable sort, ties stay in order of first appearance
+    return sorted(counts.items(), key=lambda item: -item[1])
+
+
+class ReportAccumulator(object):
+    """
+    Partial statistics of a chat which can be built chunk by chunk and merged: the message cube (counts per sender,
+    date and hour, from which every bucketed count, total and the most active day are read), word and emoji counts
+    and numbers of pictures of every sender.
+    """
+
+    def __init__(self):
+        self._cube = None
+        self._senders = list()
+        self._word_counts = dict()
+        self._emoji_counts = dict()
+        self._pictures = dict()
+        self._number_of_rows = 0
+
+    def add(self, messages_df):
+        """
+        Add a chunk of messages, sent after the messages added so far.
+
+        Args:
+            messages_df (pd.DataFrame): Messages with sender, datetime and processed text columns
+        """
+        chunk_accumulator = ReportAccumulator()
+        chunk_accumulator._cube = MessageCube(messages_df)
+        chunk_accumulator._number_of_rows = len(messages_df)
+
+        for sender, sender_messages_df in messages_df.groupby(SENDER_COL, observed=True, sort=False):
+            texts = sender_messages_df[TEXT_COL]
+            token_index = TokenIndex(texts)
+            emoji_index = EmojiIndex(texts)
+
+            chunk_accumulator._senders.append(sender)
+            chunk_accumulator._word_counts[sender] = dict(zip(token_index.get_vocabulary(), token_index.get_word_counts().tolist()))
+            chunk_accumulator._emoji_counts[sender] = dict(zip(emoji_index.get_vocabulary(), emoji_index.get_emoji_counts().tolist()))
+            chunk_accumulator._pictures[sender] = int((texts.str.strip() == '[[photo]]').sum())
+
+        return self.merge(chunk_accumulator)
+
+    def merge(self, other):
+        """
+        Merge the statistics of messages sent after the messages of this accumulator, e.g. of the next chunk.
+
+        Args:
+            other (ReportAccumulator): Statistics of the later messages
+
+        Returns:
+            ReportAccumulator: This accumulator, with the merged statistics
+        """
+        if other._cube is not None:
+            self._cube = other._cube if self._cube is None else merge_cubes([self._cube, other._cube])
+
+        for sender in other._senders:
+            if sender not in self._word_counts:
+                self._senders.append(sender)
+                self._word_counts[sender] = dict()
+                self._emoji_counts[sender] = dict()
+                self._pictures[sender] = 0
+
+            _merge_counts(self._word_counts[sender], other._word_counts[sender])
+            _merge_counts(self._emoji_counts[sender], other._emoji_counts[sender])
+            self._pictures[sender] += other._pictures[sender]
+
+        self._number_of_rows += other._number_of_rows
+
+        return self
+
+    def get_senders(self):
+        """
+        Get the senders in order of their first message.
+        """
+        return list(self._senders)
+
+    def get_number_of_rows(self):
+        return self._number_of_rows
+
+    def get_cube(self):
+        if self._cube is None:
+            return MessageCube(cube_df=pd.DataFrame(columns=CUBE_KEY_COLS + CUBE_VALUE_COLS + ['month', 'weekday']))
+
+        return self._cube
+
+    def get_frequent_words(self, sender):
+        return _get_frequent(self._word_counts.get(sender, dict()))
+
+    def get_frequent_emojis(self, sender):
+        return _get_frequent(self._emoji_counts.get(sender, dict()))
+
+    def get_number_of_pictures_sent(self, sender):
+        return self._pictures.get(sender, 0)
+
+
+class SummaryReport(BaseReport):
+    """
+    Report of a person read from partial statistics instead of messages, with the same results as Report for the
+    statistics of BaseReport: counts, totals, frequent words and emojis, pictures and the most active day. Statistics
+    of single messages and sessions need the messages, build a Report for them.
+    """
+
+    def __init__(self, accumulator, sender):
+        """
+        Args:
+            accumulator (ReportAccumulator): Statistics of the messages of the chat, or anything with its interface
+                such as windows.WindowStatistics
+            sender (str): Name of the sender
+        """
+        super(SummaryReport, self).__init__(sender)
+        self._accumulator = accumulator
+
+    def _get_metrics_rows(self):
+        return self._accumulator.get_number_of_rows()
+
+    @memoized('messages')
+    def get_cube(self):
+        return self._accumulator.get_cube().get_sender_cube(self._sender)
+
+    @memoized('messages')
+    def get_number_of_pictures_sent(self):
+        return self._accumulator.get_number_of_pictures_sent(self._sender)
+
+    @memoized('messages')
+    def get_frequent_words(self):
+        return self._accumulator.get_frequent_words(self._sender)
+
+    @memoized('messages')
+    def get_frequent_emojis(self):
+        return self._accumulator.get_frequent_emojis(self._sender)
+
+
+def get_summary_reports(messages_file_path=PROCESSED_MESSAGES_PATH, senders=None, separator=CSV_SEP, start_date=None,
+                        end_date=None, chunk_size=OUT_OF_CORE_CHUNK_SIZE):
+    """
+    Build a SummaryReport for every sender, reading the processed messages a chunk at a time so that only one chunk
+    and the partial statistics are ever in memory.
+
+    Args:
+        messages_file_path (str): Processed messages file, its extension picks the format
+        senders (list of str): Senders to report on, in this order. All senders, in order of appearance, if None
+        separator (str): Field separator when reading CSV
+        start_date (datetime): Start of the window. No limit if None
+        end_date (datetime): End of the window. No limit if None
+        chunk_size (int): Number of rows read at a time
+
+    Returns:
+        list of SummaryReport: Report of every sender
+    """
+    accumulator = ReportAccumulator()
+
+    with stage('summary.get_summary_reports') as record:
+        for chunk in iter_messages_chunks(messages_file_path, chunk_size, separator=separator, start_date=start_date, end_date=end_date):
+            accumulator.add(chunk)
+
+        record['rows'] = accumulator.get_number_of_rows()
+
+    return [SummaryReport(accumulator, sender) for sender in (senders or accumulator.get_senders())]
@@ -0,0 +1,104 @@
+from chat_messages.config import MESSAGES_ENCODING, MESSAGE_DATETIME_FORMAT
+
+import pandas as pd
+import numpy as np
+
+
+WORDS = ['i', 'you', 'the', 'to', 'a', 'and', 'is', 'it', 'ok', 'what', 'are', 'love', 'home', 'now', 'yes', 'no',
+         'haha', 'good', 'night', 'morning', 'coming', 'where', 'food', 'call', 'me', 'later', 'tomorrow', 'office',
+         'done', 'sure', 'hmm', 'why', 'did', 'eat', 'sleep', 'miss', 'reached', 'leaving', 'traffic', 'movie']
+PUNCTUATION = [',', '.', '?', '!']
+SMILEYS = [':)', ':P', ':(']
+EMOJIS = ['😀', '😂', '❤', '😘', '👍', '🙏', '😋',
+          # Multi-codepoint: skin tone, ZWJ family, flag, variation selector
+          '👍🏽', '👨‍👩‍👧', '🇮🇳', '❤️']
+SPECIAL_TEXTS = ['[[photo]]', '[[sticker]]', '[[voice]]']
+
+DEFAULT_SENDERS = ['Sravan', 'Harsha']
+BATCH_SIZE = 100000
+
+
+def get_senders(num_senders):
+    """
+    Get sender names for a synthetic chat. Two senders are the names the default config knows. Other members are
+    numbered with zero padding, so that no name contains another and get_sender_aliases matches each one to itself.
+    """
+    if num_senders <= len(DEFAULT_SENDERS):
+        return DEFAULT_SENDERS[:num_senders]
+
+    num_digits = len(str(num_senders))
+
+    return DEFAULT_SENDERS + ['Member {:0{}d}'.format(member_idx, num_digits) for member_idx in range(len(DEFAULT_SENDERS) + 1, num_senders + 1)]
+
+
+def get_sender_aliases(senders):
+    return {sender: sender for sender in senders}
+
+
+def _get_message_text(rng, num_words, kind):
+    if kind == 'special':
+        return SPECIAL_TEXTS[rng.integers(len(SPECIAL_TEXTS))]
+
+    if kind == 'link':
+        return 'https://example.com/{}'.format(rng.integers(1000000))
+
+    # Zipf-like word frequencies
+    tokens = [WORDS[(word_idx - 1) % len(WORDS)] for word_idx in rng.zipf(1.5, num_words)]
+
+    for _ in range(rng.binomial(num_words, 0.1)):
+        extras = [PUNCTUATION, SMILEYS, EMOJIS][rng.integers(3)]
+        position = rng.integers(len(tokens))
+        tokens[position] += extras[rng.integers(len(extras))]
+
+    if kind == 'multi_line':
+        cuts = sorted(set(rng.integers(1, len(tokens), 2).tolist())) if len(tokens) > 1 else []
+        lines = [' '.join(tokens[start:end]) for start, end in zip([0] + cuts, cuts + [len(tokens)])]
+
+        return '\n'.join(lines)
+
+    return ' '.join(tokens).capitalize()
+
+
+def iter_export_lines(num_messages, senders=DEFAULT_SENDERS, start_date='2012-01-01', seed=0):
+    """
+    Generate a Telegram text export in the "dd.mm.yyyy HH:MM:SS, Sender: text" format read by cleanup, with multi-line
+    messages, emojis, smileys, special texts and links.
+
+    Args:
+        num_messages (int): Number of messages
+        senders (list of str): User names of the participants
+        start_date (str): Time of the first message
+        seed (int): Seed of the random generator, the same seed gives the same export
+
+    Yields:
+        str: Batches of export lines
+    """
+    rng = np.random.default_rng(seed)
+    current_time = pd.Timestamp(start_date)
+    kinds = ['text', 'multi_line', 'special', 'link']
+    kind_probabilities = [0.86, 0.05, 0.06, 0.03]
+
+    for batch_start in range(0, num_messages, BATCH_SIZE):
+        batch_size = min(BATCH_SIZE, num_messages - batch_start)
+
+        # Bursty conversations: mostly short gaps, sometimes hours
+        gaps = np.where(rng.random(batch_size) < 0.9, rng.exponential(60, batch_size), rng.exponential(4 * 3600, batch_size))
+        datetimes = current_time + pd.to_timedelta(np.cumsum(gaps).astype('int64'), unit='s')
+        current_time = datetimes[-1]
+
+        time_strs = datetimes.strftime(MESSAGE_DATETIME_FORMAT)
+        sender_idxs = rng.integers(len(senders), size=batch_size)
+        num_words = rng.geometric(0.2, batch_size)
+        message_kinds = rng.choice(len(kinds), size=batch_size, p=kind_probabilities)
+
+        yield ''.join('{}, {}: {}\n'.format(time_str, senders[sender_idx], _get_message_text(rng, words, kinds[kind]))
+                      for time_str, sender_idx, words, kind in zip(time_strs, sender_idxs, num_words, message_kinds))
+
+
+def write_export(file_path, num_messages, senders=DEFAULT_SENDERS, start_date='2012-01-01', seed=0):
+    """
+    Write a synthetic Telegram text export, see iter_export_lines.
+    """
+    with open(file_path, 'w', encoding=MESSAGES_ENCODING) as f:
+        for lines in iter_export_lines(num_messages, senders, start_date, seed):
+            f.write(lines)
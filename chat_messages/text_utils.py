@@ -1,4 +1,20 @@
-import emoji
+import pandas as pd
+import re
+
+
+SPECIAL_CHARACTERS = [',', '.']
+SMILEY_EMOJIS = [(':)', '😀'), (':p', '😟'), (':(', '😋')]
+
+# Ranges of emoji code points closer than this are checked as one range before matching an emoji
+EMOJI_CLASS_MAX_GAP = 1024
+
+# Separates texts of a batch. Not whitespace, so it survives whitespace normalization
+BATCH_SEP = '\x00'
+
+_emoji_set = None
+_emoji_re = None
+_normalizer_re = None
+_smiley_emojis = dict(SMILEY_EMOJIS)
 
 
 def identify_special_texts(text):
@@ -27,15 +43,98 @@ def identify_forwards(text):
         return False
 
 
+def get_emoji_set():
+    """
+    Get every emoji known to the emoji package, including multi-codepoint sequences such as skin tones, ZWJ families
+    and flags. Loaded on first use.
+    """
+    global _emoji_set
+
+    if _emoji_set is None:
+        import emoji
+
+        # EMOJI_DATA from emoji 2.0, UNICODE_EMOJI before, keyed by language from 1.0
+        emoji_data = getattr(emoji, 'EMOJI_DATA', None)
+
+        if emoji_data is None:
+            emoji_data = emoji.UNICODE_EMOJI
+            emoji_data = emoji_data.get('en', emoji_data)
+
+        _emoji_set = frozenset(emoji_data)
+
+    return _emoji_set
+
+
+def _get_char_class(chars, max_gap=1):
+    """
+    Get a character class of chars as ranges of code points. The regex engine checks ranges of characters outside of
+    the basic plane one by one, so fewer ranges match faster. Ranges up to max_gap apart are merged, matching a
+    superset of chars. Latin-1 characters, frequent in any text, are never merged.
+    """
+    code_points = sorted({ord(char) for char in chars})
+    ranges = [[code_points[0], code_points[0]]]
+
+    for code_point in code_points[1:]:
+        if code_point - ranges[-1][1] <= (max_gap if ranges[-1][1] > 0xff else 1):
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point])
+
+    return '[' + ''.join(re.escape(chr(first)) if first == last else re.escape(chr(first)) + '-' + re.escape(chr(last))
+                         for first, last in ranges) + ']'
+
+
+def _get_trie_pattern(trie):
+    # Alternatives of a trie node never share a first character, so the regex engine never backtracks into them.
+    # Emojis without continuations are tried first, as one character class
+    single_chars = list()
+    alternatives = list()
+
+    for char, child in sorted((char, child) for char, child in trie.items() if char):
+        if list(child) == ['']:
+            single_chars.append(char)
+        else:
+            alternatives.append(re.escape(char) + _get_trie_pattern(child))
+
+    if single_chars:
+        alternatives.insert(0, re.escape(single_chars[0]) if len(single_chars) == 1 else _get_char_class(single_chars))
+
+    pattern = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+
+    # A greedy optional suffix tries the longer emoji first
+    return '(?:' + pattern + ')?' if '' in trie else pattern
+
+
+def get_emoji_re():
+    """
+    Get the pattern matching the longest emoji at a position, compiled on first use from a trie of all emojis so that
+    a match costs one step per character. A coarse class of first characters rejects most other positions at once.
+    """
+    global _emoji_re
+
+    if _emoji_re is None:
+        first_chars = _get_char_class([emoji_str[0] for emoji_str in get_emoji_set()], max_gap=EMOJI_CLASS_MAX_GAP)
+        trie = dict()
+
+        for emoji_str in get_emoji_set():
+            node = trie
+
+            for char in emoji_str:
+                node = node.setdefault(char, dict())
+
+            node[''] = dict()
+
+        _emoji_re = re.compile('(?={}){}'.format(first_chars, _get_trie_pattern(trie)))
+
+    return _emoji_re
+
+
 def char_is_emoji(char):
-    return char in emoji.UNICODE_EMOJI
+    return char in get_emoji_set()
 
 
 def text_has_emoji(text):
-    for character in text:
-        if character in emoji.UNICODE_EMOJI:
-            return True
-    return False
+    return get_emoji_re().search(text) is not None
 
 
 def separate_emojis_at_the_end_of_tokens(text):
@@ -69,10 +168,71 @@ def separate_special_characters_at_the_end_of_tokens(text):
 
 
 def convert_smileys_to_emojis(text):
-    smileys = [':)', ':p', ':(']
-    emojis = ['😀', '😟','😋']
-
-    for smiley, emoji in zip(smileys, emojis):
+    for smiley, emoji in SMILEY_EMOJIS:
         text = text.replace(smiley, emoji)
 
     return text
+
+
+def get_normalizer_re():
+    """
+    Get the pattern matching, in order of priority, smileys, whole emojis and special characters. Compiled on first use.
+    """
+    global _normalizer_re
+
+    if _normalizer_re is None:
+        # Special characters are stripped before smileys are converted, so they may appear inside a smiley
+        special_characters = ''.join(re.escape(char) for char in SPECIAL_CHARACTERS)
+        smileys = '|'.join(re.escape(smiley[0]) + '[{}]*'.format(special_characters) + re.escape(smiley[1:])
+                           for smiley, _ in SMILEY_EMOJIS)
+        _normalizer_re = re.compile('(?P<smiley>{})|(?P<emoji>{})|[{}]'.format(smileys, get_emoji_re().pattern, special_characters))
+
+    return _normalizer_re
+
+
+def _normalize_match(match):
+    if match.lastgroup == 'smiley':
+        smiley = match.group()
+
+        return _smiley_emojis[smiley[0] + smiley[-1]]
+    elif match.lastgroup == 'emoji':
+        return ' ' + match.group() + ' '
+    else:
+        return ''
+
+
+def normalize_text(text):
+    """
+    Lowercase a text, separate emojis into tokens, keeping multi-codepoint emojis whole, strip special characters,
+    convert smileys to emojis and squeeze whitespace in a single scan.
+
+    Args:
+        text (str): Raw message text
+
+    Returns:
+        str: Normalized text
+    """
+    return ' '.join(get_normalizer_re().sub(_normalize_match, text.lower()).split())
+
+
+def normalize_texts(texts):
+    """
+    Normalize a whole column of texts like normalize_text, with one scan over the joined batch.
+
+    Args:
+        texts (pd.Series): Raw message texts
+
+    Returns:
+        pd.Series: Normalized texts with the same index
+    """
+    if not len(texts):
+        return pd.Series([], index=texts.index, dtype=object)
+
+    batch = BATCH_SEP.join(texts.astype(str).tolist()).lower()
+    batch = get_normalizer_re().sub(_normalize_match, batch)
+
+    # Squeeze whitespace, then drop it around text boundaries
+    batch = re.sub(r'\s+', ' ', batch)
+    batch = re.sub(' ?{} ?'.format(BATCH_SEP), BATCH_SEP, batch).strip(' ')
+
+    return pd.Series(batch.split(BATCH_SEP), index=texts.index, dtype=object)
@@ -0,0 +1,73 @@
+import pandas as pd
+
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+TIME_FEATURE_COLS = ['year', 'month', 'date', 'hour', 'minute', 'second', 'weekday']
+TIME_FEATURE_DTYPES = {'year': 'int16', 'month': 'int8', 'date': 'int8', 'hour': 'int8', 'minute': 'int8', 'second': 'int8',
+                       'weekday': pd.CategoricalDtype(WEEKDAYS)}
+
+
+def get_time_features(datetimes):
+    """
+    Get calendar features of timestamps with column-wise datetime operations.
+
+    Args:
+        datetimes (pd.Series): datetime64 timestamps
+
+    Returns:
+        pd.DataFrame: Small integer year, month, date, hour, minute, second and categorical weekday columns
+    """
+    dt = datetimes.dt
+
+    return pd.DataFrame({'year': dt.year.astype(TIME_FEATURE_DTYPES['year']),
+                         'month': dt.month.astype(TIME_FEATURE_DTYPES['month']),
+                         'date': dt.day.astype(TIME_FEATURE_DTYPES['date']),
+                         'hour': dt.hour.astype(TIME_FEATURE_DTYPES['hour']),
+                         'minute': dt.minute.astype(TIME_FEATURE_DTYPES['minute']),
+                         'second': dt.second.astype(TIME_FEATURE_DTYPES['second']),
+                         'weekday': pd.Categorical.from_codes(dt.dayofweek, categories=WEEKDAYS)},
+                        index=datetimes.index)[TIME_FEATURE_COLS]
+
+
+def get_messages_time_features(messages_df, datetime_col='datetime'):
+    """
+    Get calendar features of messages, reusing the columns added by cleanup when the frame has them.
+    """
+    if set(TIME_FEATURE_COLS).issubset(messages_df.columns):
+        return messages_df[TIME_FEATURE_COLS]
+
+    return get_time_features(messages_df[datetime_col])
+
+
+def get_day_keys(time_features):
+    """
+    Get an integer yyyymmdd key per row of time features.
+    """
+    return (time_features['year'].astype('int32') * 10000 + time_features['month'].astype('int32') * 100 +
+            time_features['date'].astype('int32'))
+
+
+def get_month_keys(time_features):
+    """
+    Get an integer yyyymm key per row of time features.
+    """
+    return time_features['year'].astype('int32') * 100 + time_features['month'].astype('int32')
+
+
+def format_day_key(day_key):
+    return '{:04d}-{:02d}-{:02d}'.format(day_key // 10000, day_key // 100 % 100, day_key % 100)
+
+
+def format_month_key(month_key):
+    return '{:04d}-{:02d}'.format(month_key // 100, month_key % 100)
+
+
+def parse_day_key(date_str):
+    return int(date_str.replace('-', ''))
+
+
+def get_weekdays_of_day_keys(day_keys):
+    """
+    Get the weekday number (Monday is 0) of integer yyyymmdd keys.
+    """
+    return pd.to_datetime(day_keys.astype(str), format='%Y%m%d').dt.dayofweek.astype('int8')
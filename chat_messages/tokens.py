@@ -0,0 +1,99 @@
+from array import array
+import numpy as np
+
+
+class TokenIndex(object):
+    """
+    Compact tokenized corpus. Every distinct word gets an integer id, the words of all messages are kept as one array
+    of ids and message i spans tokens[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, messages=None, vocabulary=None, tokens=None, offsets=None):
+        """
+        Constructor to tokenize messages, or to wrap an already built index.
+
+        Args:
+            messages (iterable of str): Messages, split into words on single spaces
+            vocabulary (list of str): Word of every id
+            tokens (np.ndarray): int32 word ids of all messages, concatenated
+            offsets (np.ndarray): int64 start of every message in tokens, followed by the number of tokens
+        """
+        if messages is not None:
+            vocabulary, tokens, offsets = self._tokenize(messages)
+
+        self._vocabulary = vocabulary
+        self._tokens = tokens
+        self._offsets = offsets
+        self._word_counts = None
+
+    @staticmethod
+    def _tokenize(messages):
+        word_ids = dict()
+        tokens = array('i')
+        offsets = array('q', [0])
+
+        for message in messages:
+            tokens.extend([word_ids.setdefault(word, len(word_ids)) for word in str(message).split(' ')])
+            offsets.append(len(tokens))
+
+        # Ids are given in order of first appearance
+        vocabulary = list(word_ids)
+
+        return vocabulary, np.frombuffer(tokens, dtype=np.int32), np.frombuffer(offsets, dtype=np.int64)
+
+    def get_vocabulary(self):
+        return self._vocabulary
+
+    def get_tokens(self):
+        return self._tokens
+
+    def get_offsets(self):
+        return self._offsets
+
+    def get_number_of_messages(self):
+        return len(self._offsets) - 1
+
+    def get_number_of_tokens(self):
+        return len(self._tokens)
+
+    def get_message_lengths(self):
+        return np.diff(self._offsets)
+
+    def get_message_words(self, message_idx):
+        return [self._vocabulary[token] for token in self._tokens[self._offsets[message_idx]:self._offsets[message_idx + 1]]]
+
+    def get_words(self):
+        return [self._vocabulary[token] for token in self._tokens]
+
+    def get_word_counts(self):
+        """
+        Get the number of occurrences of every word id.
+
+        Returns:
+            np.ndarray: Count of every id of the vocabulary
+        """
+        if self._word_counts is None:
+            self._word_counts = np.bincount(self._tokens, minlength=len(self._vocabulary))
+
+        return self._word_counts
+
+    def get_frequent_words(self, is_wanted=None):
+        """
+        Get words sorted by decreasing frequency, ties in order of first appearance.
+
+        Args:
+            is_wanted (function): Only keep words for which this returns True. All words if None
+
+        Returns:
+            list of tuples: Words and frequencies
+        """
+        word_counts = self.get_word_counts()
+        word_ids = np.argsort(-word_counts, kind='stable')
+        word_ids = word_ids[word_counts[word_ids] > 0]
+
+        frequent_words = [(self._vocabulary[word_id], int(word_counts[word_id])) for word_id in word_ids]
+
+        if is_wanted is not None:
+            frequent_words = [(word, count) for word, count in frequent_words if is_wanted(word)]
+
+        return frequent_words
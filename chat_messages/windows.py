@@ -0,0 +1,212 @@
+from chat_messages.config import SENDER_COL, TEXT_COL, DATETIME_COL
+from chat_messages.store import sort_by_time
+from chat_messages.aggregates import MessageCube
+from chat_messages.tokens import TokenIndex
+from chat_messages.emojis import EmojiIndex
+from chat_messages.summary import SummaryReport
+from chat_messages.metrics import stage
+
+import pandas as pd
+import numpy as np
+
+
+# Calendar periods of get_calendar_windows, as pandas period frequencies
+PERIOD_FREQS = {'year': 'Y', 'quarter': 'Q', 'month': 'M', 'week': 'W'}
+
+
+def get_calendar_windows(start_date, end_date, period):
+    """
+    Get the calendar periods overlapping a time range as windows.
+
+    Args:
+        start_date (datetime): Start of the range
+        end_date (datetime): End of the range
+        period (str): 'year', 'quarter', 'month' or 'week'
+
+    Returns:
+        list of tuples: First and last day of every period
+    """
+    periods = pd.period_range(pd.Timestamp(start_date), pd.Timestamp(end_date), freq=PERIOD_FREQS[period])
+
+    return [(period.start_time.normalize(), period.end_time.normalize()) for period in periods]
+
+
+def get_rolling_windows(start_date, end_date, num_days, step_days):
+    """
+    Get windows of num_days days, starting every step_days days from start_date and ending by end_date.
+
+    Returns:
+        list of tuples: First and last day of every window
+    """
+    starts = pd.date_range(pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize() - pd.Timedelta(days=num_days - 1),
+                           freq='{}D'.format(step_days))
+
+    return [(start, start + pd.Timedelta(days=num_days - 1)) for start in starts]
+
+
+def _get_day_key(date):
+    date = pd.Timestamp(date)
+
+    return date.year * 10000 + date.month * 100 + date.day
+
+
+def _get_frequent(ids, vocabulary):
+    # Same order as a TokenIndex of the window alone: decreasing count, ties in order of first appearance
+    if not len(ids):
+        return list()
+
+    unique_ids, first_idx, counts = np.unique(ids, return_index=True, return_counts=True)
+    order = np.lexsort((first_idx, -counts))
+
+    return [(vocabulary[unique_ids[idx]], int(counts[idx])) for idx in order]
+
+
+class _SenderIndex(object):
+    # Time-sorted words, emojis and pictures of one sender, sliced by window with binary searches
+    def __init__(self, sender_messages_df):
+        texts = sender_messages_df[TEXT_COL]
+
+        self.nanoseconds = sender_messages_df[DATETIME_COL].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        self.token_index = TokenIndex(texts)
+        self.emoji_index = EmojiIndex(texts)
+        self.picture_counts = np.concatenate([[0], np.cumsum((texts.str.strip() == '[[photo]]').to_numpy(dtype=bool))])
+
+    def get_message_range(self, start, end):
+        return np.searchsorted(self.nanoseconds, start, side='left'), np.searchsorted(self.nanoseconds, end, side='left')
+
+
+class ChatIndex(object):
+    """
+    Everything needed to report on any window of days of a chat, built with one scan over its messages: a message
+    cube of counts per sender, date and hour, and the time-sorted words, emojis and pictures of every sender. A
+    window's statistics are rolled up from the cube and from slices of the indexes, never by filtering the messages.
+    """
+
+    def __init__(self, messages_df):
+        """
+        Args:
+            messages_df (pd.DataFrame): Messages of all senders with sender, datetime and processed text columns
+        """
+        messages_df = sort_by_time(messages_df)
+
+        self._cube = MessageCube(messages_df)
+        self._senders = list()
+        self._sender_indexes = dict()
+
+        for sender, sender_messages_df in messages_df.groupby(SENDER_COL, observed=True, sort=False):
+            self._senders.append(sender)
+            self._sender_indexes[sender] = _SenderIndex(sender_messages_df)
+
+    def get_senders(self):
+        """
+        Get the senders in order of their first message.
+        """
+        return list(self._senders)
+
+    def get_window(self, start_date, end_date):
+        """
+        Get the statistics of the messages sent between two days, both included.
+
+        Args:
+            start_date (datetime): First day of the window
+            end_date (datetime): Last day of the window
+
+        Returns:
+            WindowStatistics: Statistics of the window
+        """
+        return WindowStatistics(self, start_date, end_date)
+
+    def get_cube(self):
+        return self._cube
+
+    def get_sender_index(self, sender):
+        return self._sender_indexes.get(sender)
+
+
+class WindowStatistics(object):
+    """
+    Statistics of the messages of a chat sent within a window of days, read from a ChatIndex. Has the interface of
+    ReportAccumulator, so that SummaryReport can report on it.
+    """
+
+    def __init__(self, chat_index, start_date, end_date):
+        self._chat_index = chat_index
+        self._start = pd.Timestamp(start_date).normalize()
+        self._end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+
+        cube_df = chat_index.get_cube().get_cube_df()
+        is_in_window = cube_df['date'].between(_get_day_key(start_date), _get_day_key(end_date)).to_numpy()
+        self._cube = MessageCube(cube_df=cube_df[is_in_window].reset_index(drop=True))
+
+    def get_window(self):
+        """
+        Get the first day of the window and the start of the day after its last day.
+        """
+        return self._start, self._end
+
+    def _get_message_range(self, sender_index):
+        return sender_index.get_message_range(self._start.value, self._end.value)
+
+    def get_senders(self):
+        return self._chat_index.get_senders()
+
+    def get_number_of_rows(self):
+        return self._cube.get_total('rows')
+
+    def get_cube(self):
+        return self._cube
+
+    def get_frequent_words(self, sender):
+        sender_index = self._chat_index.get_sender_index(sender)
+
+        if sender_index is None:
+            return list()
+
+        first_idx, last_idx = self._get_message_range(sender_index)
+        offsets = sender_index.token_index.get_offsets()
+
+        return _get_frequent(sender_index.token_index.get_tokens()[offsets[first_idx]:offsets[last_idx]],
+                             sender_index.token_index.get_vocabulary())
+
+    def get_frequent_emojis(self, sender):
+        sender_index = self._chat_index.get_sender_index(sender)
+
+        if sender_index is None:
+            return list()
+
+        first_idx, last_idx = self._get_message_range(sender_index)
+        offsets = sender_index.emoji_index.get_offsets()
+
+        return _get_frequent(sender_index.emoji_index.get_emoji_ids()[offsets[first_idx]:offsets[last_idx]],
+                             sender_index.emoji_index.get_vocabulary())
+
+    def get_number_of_pictures_sent(self, sender):
+        sender_index = self._chat_index.get_sender_index(sender)
+
+        if sender_index is None:
+            return 0
+
+        first_idx, last_idx = self._get_message_range(sender_index)
+
+        return int(sender_index.picture_counts[last_idx] - sender_index.picture_counts[first_idx])
+
+
+def get_window_reports(messages_df, windows, senders=None):
+    """
+    Build reports of every sender for many windows of days from one scan over the messages.
+
+    Args:
+        messages_df (pd.DataFrame): Messages of all senders, e.g. from get_messages_dataframe without a window
+        windows (list of tuples): First and last day of every window, e.g. from get_calendar_windows
+        senders (list of str): Senders to report on, in this order. All senders, in order of appearance, if None
+
+    Returns:
+        list of list of SummaryReport: Reports of every sender, for every window
+    """
+    with stage('windows.ChatIndex', len(messages_df)):
+        chat_index = ChatIndex(messages_df)
+
+    senders = senders or chat_index.get_senders()
+
+    return [[SummaryReport(chat_index.get_window(start_date, end_date), sender) for sender in senders]
+            for start_date, end_date in windows]
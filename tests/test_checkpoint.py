@@ -0,0 +1,91 @@
+from chat_messages.cleanup import get_messages, get_messages_df, get_new_messages_df
+from chat_messages.checkpoint import make_checkpoint
+from chat_messages.store import get_compact_messages_df
+from chat_messages.synthetic import iter_export_lines
+
+import pandas as pd
+import pytest
+import re
+
+
+HEADER_RE = re.compile(r'^\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}:\d{2}, ', re.MULTILINE)
+
+
+@pytest.fixture
+def export(tmp_path):
+    """
+    Synthetic export split at a message start into bytes ingested by a first run and bytes appended after it.
+    """
+    text = ''.join(iter_export_lines(300, seed=1))
+    split_idx = [match.start() for match in HEADER_RE.finditer(text)][200]
+
+    return tmp_path / 'export.txt', text[:split_idx].encode('utf-8'), text[split_idx:].encode('utf-8')
+
+
+def ingest(file_path, data):
+    """
+    Write an export and process it in full, as the first run does.
+
+    Returns:
+        tuple: Processed messages and the checkpoint of the run
+    """
+    file_path.write_bytes(data)
+    messages_df = get_messages_df(get_messages(str(file_path)))
+
+    return messages_df, make_checkpoint(str(file_path), len(data), messages_df['datetime'].iloc[-1])
+
+
+def get_new_messages(file_path, checkpoint, data):
+    file_path.write_bytes(data)
+
+    return get_new_messages_df(str(file_path), checkpoint, len(data), num_workers=1)
+
+
+def test_incremental_run_equals_full_rebuild(export):
+    file_path, old_data, new_data = export
+    old_messages_df, checkpoint = ingest(file_path, old_data)
+
+    new_messages_df = get_new_messages(file_path, checkpoint, old_data + new_data)
+    full_messages_df, _ = ingest(file_path, old_data + new_data)
+
+    assert new_messages_df is not None and len(new_messages_df)
+    pd.testing.assert_frame_equal(get_compact_messages_df(pd.concat([old_messages_df, new_messages_df], ignore_index=True)),
+                                  full_messages_df)
+
+
+def test_nothing_appended(export):
+    file_path, old_data, _ = export
+    _, checkpoint = ingest(file_path, old_data)
+
+    assert len(get_new_messages(file_path, checkpoint, old_data)) == 0
+
+
+def test_changed_prefix_rebuilds(export):
+    file_path, old_data, new_data = export
+    _, checkpoint = ingest(file_path, old_data)
+
+    # Same size, one byte of the last processed message edited
+    changed_data = old_data[:-2] + (b'X' if old_data[-2:-1] != b'X' else b'Y') + old_data[-1:]
+
+    assert get_new_messages(file_path, checkpoint, changed_data + new_data) is None
+
+
+def test_shrunk_export_rebuilds(export):
+    file_path, old_data, _ = export
+    _, checkpoint = ingest(file_path, old_data)
+
+    assert get_new_messages(file_path, checkpoint, old_data[:len(old_data) // 2]) is None
+
+
+def test_append_continuing_last_message_rebuilds(export):
+    file_path, old_data, new_data = export
+    _, checkpoint = ingest(file_path, old_data)
+
+    assert get_new_messages(file_path, checkpoint, old_data + b'continued line of the last message\n' + new_data) is None
+
+
+def test_append_older_than_checkpoint_rebuilds(export):
+    file_path, old_data, _ = export
+    _, checkpoint = ingest(file_path, old_data)
+
+    assert get_new_messages(file_path, checkpoint, old_data + b'01.01.2000 10:00:00, Sravan: from the past\n') is None
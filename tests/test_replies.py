@@ -0,0 +1,27 @@
+from chat_messages.replies import get_replies, get_latency_stats
+
+import pandas as pd
+
+
+def get_messages_df(senders, datetimes):
+    return pd.DataFrame({'sender': senders, 'datetime': pd.to_datetime(datetimes), 'processed_text': ['hi'] * len(senders)})
+
+
+def test_latency_stats():
+    messages_df = get_messages_df(['Sravan', 'Harsha', 'Sravan'], ['2017-01-01 10:00:00', '2017-01-01 10:01:00', '2017-01-01 10:03:00'])
+
+    stats = get_latency_stats(get_replies(messages_df), percentiles=[50])
+
+    assert stats['sender'].tolist() == ['Harsha', 'Sravan']
+    assert stats['replies'].tolist() == [1, 1]
+    assert stats['p50'].tolist() == [60.0, 120.0]
+
+
+def test_latency_stats_without_replies():
+    messages_df = get_messages_df(['Sravan', 'Sravan'], ['2017-01-01 10:00:00', '2017-01-01 10:01:00'])
+
+    for by in [['sender'], ['sender', 'hour']]:
+        stats = get_latency_stats(get_replies(messages_df), by=by, percentiles=[50, 90, 99])
+
+        assert len(stats) == 0
+        assert stats.columns.tolist() == by + ['replies', 'mean', 'p50', 'p90', 'p99']
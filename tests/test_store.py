@@ -0,0 +1,15 @@
+from chat_messages.store import slice_by_time
+
+import pandas as pd
+
+
+def test_slice_by_time_with_finer_bounds_than_column():
+    messages_df = pd.DataFrame({'datetime': pd.to_datetime(['2017-01-01 10:00:00', '2017-01-01 23:59:59', '2017-01-02 00:00:00']).as_unit('us')})
+    day_start = pd.Timestamp('2017-01-01')
+
+    # Inclusive end of day, one nanosecond before the next day
+    day_df = slice_by_time(messages_df, day_start, day_start + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns'))
+
+    assert day_df['datetime'].tolist() == messages_df['datetime'].iloc[:2].tolist()
+    assert len(slice_by_time(messages_df, day_start + pd.Timedelta(1, 'ns'))) == 3
+    assert len(slice_by_time(messages_df, end_date='2017-01-02')) == 3